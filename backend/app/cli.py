@@ -0,0 +1,60 @@
+import argparse
+import asyncio
+
+from app.database import async_session_maker, close_db, init_db
+from app.services import MailboxService, PackedStorage, SweeperService
+
+
+async def reconcile_counters():
+    await init_db()
+    async with async_session_maker() as session:
+        await MailboxService.reconcile(session)
+    await close_db()
+
+    print("Mailbox counters reconciled")
+
+async def compact_storage(min_dead_ratio: float | None):
+    await init_db()
+    async with async_session_maker() as session:
+        reclaimed = await PackedStorage().compact(session, min_dead_ratio)
+    await close_db()
+
+    print(f"Reclaimed {reclaimed} bytes from attachment packfiles")
+
+async def collect_garbage(batch_size: int | None, delay: float | None):
+    await init_db()
+    async with async_session_maker() as session:
+        report = await SweeperService.sweep(session, batch_size, delay)
+    await close_db()
+
+    print(f"Garbage collection finished: {report}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Backend maintenance commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("reconcile-counters", help="Recompute mailbox and per-message counters from the message tables")
+
+    compact_parser = subparsers.add_parser("compact-storage", help="Rewrite attachment packfiles that are mostly deleted entries")
+    compact_parser.add_argument(
+        "--min-dead-ratio",
+        type=float,
+        default=None,
+        help="Only compact packs with at least this fraction of dead bytes (default ATTACHMENT_PACK_COMPACT_RATIO)"
+    )
+
+    gc_parser = subparsers.add_parser("gc", help="Delete fully-deleted messages, expired uploads and orphan attachment files")
+    gc_parser.add_argument("--batch-size", type=int, default=None, help="Rows or files per batch (default GC_BATCH_SIZE)")
+    gc_parser.add_argument("--delay", type=float, default=None, help="Seconds to sleep between batches (default GC_BATCH_DELAY)")
+
+    args = parser.parse_args()
+
+    if args.command == "reconcile-counters":
+        asyncio.run(reconcile_counters())
+    elif args.command == "compact-storage":
+        asyncio.run(compact_storage(args.min_dead_ratio))
+    elif args.command == "gc":
+        asyncio.run(collect_garbage(args.batch_size, args.delay))
+
+if __name__ == "__main__":
+    main()
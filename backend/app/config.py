@@ -1,4 +1,5 @@
 from functools import lru_cache
+from typing import Literal
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -17,6 +18,8 @@ class Settings(BaseSettings):
 
     JWT_SECRET_KEY: str = "TEMPORARY_JWT_SECRET_KEY_TO_BE_CHANGED_FOR_PRODUCTION"
     JWT_ALGORITHM: str = "HS256"
+    # "hmac" is a standard library implementation for the HS* algorithms
+    JWT_BACKEND: Literal["jose", "hmac"] = "jose"
     JWT_ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     JWT_REFRESH_TOKEN_EXPIRE_DAYS: int = 7
 
@@ -27,6 +30,12 @@ class Settings(BaseSettings):
     # ==========================================================================
 
     DATABASE_URL: str = "sqlite+aiosqlite:///./data/app.db"
+
+    SQLITE_WAL_ENABLED: bool = True
+    SQLITE_READ_POOL_SIZE: int = 4
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    SQLITE_CACHE_SIZE_KB: int = 65536
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024 # 256MB
     
     # ==========================================================================
     # Password security
@@ -43,6 +52,10 @@ class Settings(BaseSettings):
     PASSWORD_REQUIRE_LOWERCASE: bool = True
     PASSWORD_REQUIRE_DIGIT: bool = True
     PASSWORD_REQUIRE_SPECIAL: bool = True
+
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_MAX_QUEUE: int = 64
+    PASSWORD_HASH_TIMEOUT: float = 10.0
     
     # ==========================================================================
     # Rate Limiting
@@ -55,9 +68,32 @@ class Settings(BaseSettings):
     RATE_LIMIT_AUTH_2FA: str = "5/minute"
 
     AUTH_FAILURE_DELAY: float = 2.0
+    # Failed requests waiting out AUTH_FAILURE_DELAY at once; more are answered 429 right away
+    TARPIT_MAX_CONNECTIONS: int = 256
 
     MAX_LOGIN_ATTEMPTS: int = 5
     LOGIN_LOCKOUT_MINUTES: int = 15
+
+    # Login attempts are written to the database in batches by a background task
+    AUDIT_FLUSH_INTERVAL: float = 1.0
+    AUDIT_BATCH_SIZE: int = 500
+    AUDIT_QUEUE_MAX_SIZE: int = 10000
+
+    # ==========================================================================
+    # Authentication caches
+    # ==========================================================================
+
+    # Caches are per process: changes made through another worker are only seen by this
+    # one once its entry expires. Token versions, revoked tokens and login lockout counters
+    # are also held in process and only loaded from the database at startup, so the app
+    # refuses to start with more than one worker (uvicorn reads WEB_CONCURRENCY for --workers)
+    WEB_CONCURRENCY: int = 1
+
+    USER_CACHE_ENABLED: bool = True
+    USER_CACHE_SIZE: int = 10000
+    USER_CACHE_TTL_SECONDS: float = 60.0
+
+    TOKEN_CACHE_SIZE: int = 10000
     
     # ==========================================================================
     # Email
@@ -102,6 +138,36 @@ class Settings(BaseSettings):
 
     ATTACHMENTS_DIR: str = "./data/attachments"
 
+    ATTACHMENT_STORAGE_BACKEND: Literal["directory", "hashed", "packed"] = "packed"
+    ATTACHMENT_PACK_MAX_OBJECT_SIZE: int = 256 * 1024 # 256KB
+    ATTACHMENT_PACK_MAX_SIZE: int = 256 * 1024 * 1024 # 256MB
+    ATTACHMENT_PACK_COMPACT_RATIO: float = 0.5
+    ATTACHMENT_PACK_GRACE_MINUTES: int = 60
+
+    ATTACHMENT_UPLOADS_DIR: str = "./data/uploads"
+    ATTACHMENT_UPLOAD_EXPIRE_HOURS: int = 24
+
+    ATTACHMENT_IO_WORKERS: int = 8
+    ATTACHMENT_READ_CHUNK_SIZE: int = 256 * 1024 # 256KB
+    ATTACHMENT_WRITE_CHUNK_SIZE: int = 1024 * 1024 # 1MB
+
+    # ==========================================================================
+    # Messages
+    # ==========================================================================
+
+    BULK_UPDATE_CHUNK_SIZE: int = 500
+    MESSAGE_BODY_INLINE_MAX_SIZE: int = 4 * 1024 # 4KB
+
+    # ==========================================================================
+    # Garbage collection
+    # ==========================================================================
+
+    GC_ENABLED: bool = True
+    GC_INTERVAL_SECONDS: int = 3600
+    GC_BATCH_SIZE: int = 200
+    GC_BATCH_DELAY: float = 0.5
+    GC_ORPHAN_GRACE_MINUTES: int = 60
+
     
     # ==========================================================================
     # Honeypot
@@ -1,11 +1,17 @@
-from sqlalchemy import StaticPool
+import datetime
+import os
+import time
+import uuid
+
+from sqlalchemy import LargeBinary, StaticPool, event
 from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.types import TypeDecorator
 
-from typing import AsyncGenerator
+from typing import Any, AsyncGenerator
 
 from app.config import get_settings
 
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 
 
 settings = get_settings()
@@ -14,12 +20,53 @@ database_url = settings.DATABASE_URL
 if database_url.startswith("sqlite:///"):
     database_url = database_url.replace("sqlite:///","sqlite+aiosqlite:///")
 
-engine = create_async_engine(
-    database_url,
-    echo=settings.DEBUG,
-    connect_args={"check_same_thread": False} if "sqlite" in database_url else {},
-    poolclass=StaticPool if "sqlite" in database_url else None
-)
+is_sqlite = "sqlite" in database_url
+is_sqlite_memory = is_sqlite and (":memory:" in database_url or database_url.rstrip("/").endswith("sqlite+aiosqlite:"))
+use_sqlite_wal = is_sqlite and not is_sqlite_memory and settings.SQLITE_WAL_ENABLED
+
+def _set_sqlite_pragmas(dbapi_connection, read_only: bool):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT_MS}")
+    if use_sqlite_wal:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA cache_size=-{settings.SQLITE_CACHE_SIZE_KB}")
+        cursor.execute(f"PRAGMA mmap_size={settings.SQLITE_MMAP_SIZE}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+    if read_only:
+        cursor.execute("PRAGMA query_only=ON")
+    cursor.close()
+
+def _create_engine(read_only: bool = False) -> AsyncEngine:
+    if not is_sqlite:
+        return create_async_engine(database_url, echo=settings.DEBUG)
+
+    if not use_sqlite_wal:
+        new_engine = create_async_engine(
+            database_url,
+            echo=settings.DEBUG,
+            connect_args={"check_same_thread": False},
+            poolclass=StaticPool
+        )
+    else:
+        # WAL allows readers to run concurrently with the single writer, so reads get a pool
+        # of connections while every write is serialized through one connection
+        new_engine = create_async_engine(
+            database_url,
+            echo=settings.DEBUG,
+            connect_args={"check_same_thread": False},
+            pool_size=settings.SQLITE_READ_POOL_SIZE if read_only else 1,
+            max_overflow=0
+        )
+
+    @event.listens_for(new_engine.sync_engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        _set_sqlite_pragmas(dbapi_connection, read_only)
+
+    return new_engine
+
+engine = _create_engine()
+read_engine = _create_engine(read_only=True) if use_sqlite_wal else engine
 
 async_session_maker = async_sessionmaker(
     engine,
@@ -29,9 +76,54 @@ async_session_maker = async_sessionmaker(
     autoflush=False
 )
 
+read_session_maker = async_sessionmaker(
+    read_engine,
+    class_=AsyncSession,
+    expire_on_commit=False,
+    autocommit=False,
+    autoflush=False
+)
+
 class Base(DeclarativeBase):
     pass
 
+class UUIDKey(TypeDecorator):
+    # Primary and foreign keys are stored as 16-byte UUIDs instead of 36-character strings,
+    # which more than halves every key and index entry. The app keeps seeing canonical UUID
+    # strings. Strings that are not UUIDs are stored as their UTF-8 bytes, so they round-trip
+    # and never match a real key.
+    impl = LargeBinary(16)
+    cache_ok = True
+
+    def process_bind_param(self, value: Any, dialect) -> Any:
+        if not isinstance(value, str):
+            return value
+        try:
+            return uuid.UUID(value).bytes
+        except ValueError:
+            return value.encode()
+
+    def process_result_value(self, value: Any, dialect) -> Any:
+        if not isinstance(value, bytes):
+            return value
+        if len(value) == 16:
+            return str(uuid.UUID(bytes=value))
+        return value.decode(errors="replace")
+
+def generate_uuid():
+    return str(uuid.uuid4())
+
+def generate_uuid7():
+    # UUIDv7: 48-bit millisecond timestamp followed by random bits, so ids sort by creation time
+    timestamp_ms = time.time_ns() // 1_000_000
+    value = (timestamp_ms & 0xFFFFFFFFFFFF) << 80 | int.from_bytes(os.urandom(10), "big")
+    value = value & ~(0xF << 76) | 0x7 << 76
+    value = value & ~(0x3 << 62) | 0x2 << 62
+    return str(uuid.UUID(int=value))
+
+def utcnow():
+    return datetime.datetime.now(datetime.timezone.utc)
+
 async def get_db() -> AsyncGenerator[AsyncSession, None]:
     async with async_session_maker() as session:
         try:
@@ -43,11 +135,28 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
         finally:
             await session.close()
 
+async def release_connection(session: AsyncSession):
+    # Ends the session's transaction so its connection (with WAL, the single writer connection)
+    # goes back to the pool during slow work such as password hashing or file writes. Loaded
+    # objects stay usable and the next statement checks a connection out again.
+    await session.commit()
+
+async def get_read_db() -> AsyncGenerator[AsyncSession, None]:
+    async with read_session_maker() as session:
+        try:
+            yield session
+        finally:
+            await session.close()
+
 async def init_db():
     async with engine.begin() as conn:
         from app.models import users, messages
+        from app.migrations import run_migrations
 
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(run_migrations)
 
 async def close_db():
     await engine.dispose()
+    if read_engine is not engine:
+        await read_engine.dispose()
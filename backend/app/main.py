@@ -1,3 +1,5 @@
+import asyncio
+import contextlib
 import os
 
 from contextlib import asynccontextmanager
@@ -10,10 +12,11 @@ from starlette.middleware.cors import CORSMiddleware
 from slowapi.errors import RateLimitExceeded
 
 from app.config import get_settings
-from app.database import close_db, init_db
-from app.middleware import HoneypotMiddleware, RateLimitMiddleware, limiter
+from app.database import async_session_maker, close_db, init_db
+from app.middleware import HoneypotMiddleware, RateLimitMiddleware, Tarpitted, limiter, tarpit_exception_handler
 from app.middleware.rate_limit import rate_limit_exceeded_handler
-from app.routers import auth_router, messages_router, users_router
+from app.routers import auth_router, messages_router, uploads_router, users_router
+from app.services import AuditService, AuthService, CryptoService, FileService, PasswordHashingUnavailable, SweeperService
 
 
 settings = get_settings()
@@ -22,13 +25,37 @@ settings = get_settings()
 async def lifespan(app: FastAPI):
     print("Starting up backend...")
 
+    if settings.WEB_CONCURRENCY > 1:
+        # Logouts, password changes and lockouts would only apply in the worker that saw them
+        raise RuntimeError(
+            f"WEB_CONCURRENCY={settings.WEB_CONCURRENCY}: token revocation and login lockout state "
+            "is kept in process, run a single worker"
+        )
+
     os.makedirs("./data", exist_ok=True)
     os.makedirs(settings.ATTACHMENTS_DIR, exist_ok=True)
+    os.makedirs(settings.ATTACHMENT_UPLOADS_DIR, exist_ok=True)
 
     await init_db()
+    async with async_session_maker() as session:
+        await AuthService.load_token_state(session)
+        await AuthService.load_login_failures(session)
     print("Database initialized")
+
+    CryptoService.start_hash_pool()
+    AuditService.start()
+    sweeper = asyncio.create_task(SweeperService.run_forever()) if settings.GC_ENABLED else None
     yield
 
+    if sweeper is not None:
+        sweeper.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await sweeper
+
+    await AuditService.stop()
+    CryptoService.shutdown_hash_pool()
+    FileService.shutdown()
+
     print("Closing database...")
     await close_db()
     print("Shutting down backend...")
@@ -56,10 +83,12 @@ app.add_middleware(RateLimitMiddleware)
 
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, rate_limit_exceeded_handler) # type: ignore[arg-type]
+app.add_exception_handler(Tarpitted, tarpit_exception_handler) # type: ignore[arg-type]
 
 app.include_router(auth_router)
 app.include_router(users_router)
 app.include_router(messages_router)
+app.include_router(uploads_router)
 
 @app.get("/health")
 async def health_check():
@@ -68,7 +97,8 @@ async def health_check():
         "app": settings.APP_NAME,
         "version": settings.APP_VERSION,
         "environment": settings.ENVIRONMENT,
-        "database": "connected"
+        "database": "connected",
+        "caches": AuthService.cache_stats()
     }
 
 @app.get("/")
@@ -79,6 +109,17 @@ async def root():
         "docs": "/docs" if settings.ENVIRONMENT == "development" else None
     }
 
+@app.exception_handler(PasswordHashingUnavailable)
+async def password_hashing_unavailable_handler(request: Request, exc: PasswordHashingUnavailable):
+    return JSONResponse(
+        status_code=503,
+        content={
+            "error": "service_unavailable",
+            "message": "Server is busy. Please try again later."
+        },
+        headers={"Retry-After": "1"}
+    )
+
 @app.exception_handler(Exception)
 async def general_exception_handler(request: Request, exc: Exception):
     import logging
@@ -1,6 +1,7 @@
 from app.middleware.rate_limit import RateLimitMiddleware, limiter
 from app.middleware.csrf import CSRFMiddleware
 from app.middleware.honeypot import HoneypotMiddleware, check_honeypot
+from app.middleware.tarpit import Tarpitted, tarpit_exception_handler
 
 __all__ = [
     "RateLimitMiddleware",
@@ -8,4 +9,6 @@ __all__ = [
     "CSRFMiddleware",
     "HoneypotMiddleware",
     "check_honeypot",
+    "Tarpitted",
+    "tarpit_exception_handler",
 ]
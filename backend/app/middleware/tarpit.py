@@ -0,0 +1,44 @@
+import asyncio
+import logging
+
+from fastapi import HTTPException
+from fastapi.exception_handlers import http_exception_handler
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+
+from app.config import get_settings
+
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+class Tarpitted(HTTPException):
+    # Raised instead of HTTPException for authentication failures. The error is answered only
+    # after AUTH_FAILURE_DELAY, by tarpit_exception_handler.
+    pass
+
+class Tarpit:
+    active: int = 0
+
+async def tarpit_exception_handler(request: Request, exc: Tarpitted) -> Response:
+    # Exception handlers run after the route's dependencies have exited, so the database
+    # session is already back in the pool while the client waits. At most TARPIT_MAX_CONNECTIONS
+    # failures wait at once; beyond that they are shed with an immediate 429.
+    if Tarpit.active >= settings.TARPIT_MAX_CONNECTIONS:
+        logger.warning(f"Tarpit full, shedding failed request to {request.url.path}")
+        return JSONResponse(
+            status_code=429,
+            content={
+                "error": "too_many_requests",
+                "message": "Too many failed attempts. Please try again later."
+            },
+            headers={"Retry-After": str(max(1, round(settings.AUTH_FAILURE_DELAY)))}
+        )
+
+    Tarpit.active += 1
+    try:
+        await asyncio.sleep(settings.AUTH_FAILURE_DELAY)
+    finally:
+        Tarpit.active -= 1
+
+    return await http_exception_handler(request, exc)
@@ -0,0 +1,401 @@
+import argparse
+import asyncio
+import base64
+import datetime
+import logging
+import os
+import uuid
+
+from typing import Callable
+
+from sqlalchemy import Connection, and_, func, or_, select, text
+from sqlalchemy.sql import Select
+
+from app.config import get_settings
+from app.database import Base, UUIDKey, engine
+
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_TABLE = "schema_migrations"
+
+class Migration:
+    def __init__(self, version: int, description: str, upgrade: Callable[[Connection], None]):
+        self.version = version
+        self.description = description
+        self.upgrade = upgrade
+
+def _create_indexes(*statements: str) -> Callable[[Connection], None]:
+    def upgrade(conn: Connection):
+        for statement in statements:
+            conn.exec_driver_sql(statement)
+    return upgrade
+
+def _add_column(conn: Connection, table: str, column: str, definition: str):
+    existing = {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table})")}
+    if column not in existing:
+        conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+def _add_mailbox_counters(conn: Connection):
+    from app.services.mailbox import MailboxService
+
+    _add_column(conn, "messages", "recipients_count", "INTEGER NOT NULL DEFAULT 0")
+    _add_column(conn, "messages", "attachments_count", "INTEGER NOT NULL DEFAULT 0")
+    # The reconcile statements already count sent messages by sender_deleted (migration 8)
+    _add_column(conn, "messages", "sender_deleted", "BOOLEAN NOT NULL DEFAULT 0")
+    MailboxService.reconcile_sync(conn)
+
+def _move_large_bodies(conn: Connection):
+    # message_bodies itself is created by create_all, which always runs before the migrations
+    _add_column(conn, "messages", "body_external", "BOOLEAN NOT NULL DEFAULT 0")
+
+    threshold = {"threshold": get_settings().MESSAGE_BODY_INLINE_MAX_SIZE}
+    conn.execute(
+        text(
+            "INSERT INTO message_bodies (message_id, body_encrypted) "
+            "SELECT id, body_encrypted FROM messages WHERE body_external = 0 AND length(body_encrypted) > :threshold"
+        ),
+        threshold
+    )
+    conn.execute(
+        text("UPDATE messages SET body_encrypted = '', body_external = 1 WHERE body_external = 0 AND length(body_encrypted) > :threshold"),
+        threshold
+    )
+
+BINARY_BATCH_SIZE = 1000
+
+# table: (base64 encoded columns, hex encoded columns)
+BINARY_COLUMNS = {
+    "messages": (["subject_encrypted", "body_encrypted", "sender_encrypted_key"], ["signature"]),
+    "message_bodies": (["body_encrypted"], []),
+    "message_recipients": (["encrypted_key"], []),
+    "attachments": (["filename_encrypted", "mime_type_encrypted"], []),
+    "attachment_uploads": (["filename_encrypted", "mime_type_encrypted"], []),
+}
+
+def _decode_legacy(value: str, is_hex: bool) -> bytes:
+    try:
+        return bytes.fromhex(value) if is_hex else base64.b64decode(value, validate=True)
+    except ValueError:
+        # Never valid base64/hex (the old schemas did not check): keep the characters as bytes
+        return value.encode()
+
+def _rewrite_columns(conn: Connection, table: str, columns: list[str], convert: Callable[[str, object], object]):
+    # SQLite keeps each value's own storage class, so values are rewritten in place in rowid
+    # batches; the declared column type does not need to change
+    assignments = ", ".join(f"{column} = ?" for column in columns)
+    last_rowid = 0
+
+    while True:
+        rows = conn.exec_driver_sql(
+            f"SELECT rowid, {', '.join(columns)} FROM {table} WHERE rowid > ? ORDER BY rowid LIMIT ?",
+            (last_rowid, BINARY_BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        last_rowid = rows[-1][0]
+
+        updates = [
+            tuple(convert(column, value) for column, value in zip(columns, row[1:])) + (row[0],)
+            for row in rows
+        ]
+        conn.exec_driver_sql(f"UPDATE {table} SET {assignments} WHERE rowid = ?", updates)
+
+def _convert_to_binary(conn: Connection):
+    # Existing TEXT values are decoded and rewritten as BLOBs
+    for table, (base64_columns, hex_columns) in BINARY_COLUMNS.items():
+        _rewrite_columns(
+            conn,
+            table,
+            base64_columns + hex_columns,
+            lambda column, value: _decode_legacy(value, column in hex_columns) if isinstance(value, str) else value
+        )
+
+# table: UUID key columns, primary and foreign
+KEY_COLUMNS = {
+    "users": ["id"],
+    "messages": ["id", "sender_id"],
+    "message_bodies": ["message_id"],
+    "message_recipients": ["message_id", "recipient_id"],
+    "attachments": ["id", "message_id"],
+    "attachment_uploads": ["id", "user_id"],
+    "mailbox_counters": ["user_id"],
+    "login_attempts": ["user_id"],
+    "password_reset_tokens": ["user_id"],
+}
+
+def _convert_keys(conn: Connection):
+    # Rewrites the 36-character UUID strings as the 16-byte values UUIDKey binds. Every table
+    # is converted in the same transaction, so joins never see a mix of both forms, and the
+    # indexes are rebuilt afterwards to drop the space the longer keys left behind.
+    key_type = UUIDKey()
+    for table, columns in KEY_COLUMNS.items():
+        _rewrite_columns(conn, table, columns, lambda column, value: key_type.process_bind_param(value, conn.dialect))
+        conn.exec_driver_sql(f"REINDEX {table}")
+
+def _add_token_version(conn: Connection):
+    # revoked_tokens itself is created by create_all
+    _add_column(conn, "users", "token_version", "INTEGER NOT NULL DEFAULT 0")
+
+# Columns holding a message id
+MESSAGE_KEY_COLUMNS = {
+    "messages": "id",
+    "message_bodies": "message_id",
+    "message_recipients": "message_id",
+    "attachments": "message_id",
+}
+
+def _is_uuid7_key(value) -> bool:
+    return isinstance(value, bytes) and len(value) == 16 and value[6] >> 4 == 7
+
+def _uuid7_key(timestamp_ms: int, sequence: int) -> bytes:
+    # generate_uuid7 with its 12 bits after the version used as a counter, so keys minted for
+    # the same millisecond keep their order
+    value = (
+        (timestamp_ms & 0xFFFFFFFFFFFF) << 80 | 0x7 << 76 | (sequence & 0xFFF) << 64
+        | 0x2 << 62 | int.from_bytes(os.urandom(8), "big") >> 2
+    )
+    return uuid.UUID(int=value).bytes
+
+def _created_at_ms(value) -> int | None:
+    if isinstance(value, str):
+        try:
+            value = datetime.datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if not isinstance(value, datetime.datetime):
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return int(value.timestamp() * 1000)
+
+def _rekey_legacy_messages(conn: Connection):
+    # Lists are ordered by message id. Messages created before ids were UUIDv7 have random
+    # UUIDv4 keys, which mostly sort above every new id and would bury new mail below them, so
+    # they get UUIDv7 keys minted from their created_at, strictly increasing in insertion order.
+    # Every column holding a message id is remapped in the same transaction.
+    conn.exec_driver_sql("CREATE TEMP TABLE message_rekeys (old_id BLOB PRIMARY KEY, new_id BLOB NOT NULL)")
+
+    last_rowid = 0
+    timestamp_ms = sequence = 0
+    while True:
+        rows = conn.exec_driver_sql(
+            "SELECT rowid, id, created_at FROM messages WHERE rowid > ? ORDER BY rowid LIMIT ?",
+            (last_rowid, BINARY_BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        last_rowid = rows[-1][0]
+
+        rekeys = []
+        for _, message_id, created_at in rows:
+            if _is_uuid7_key(message_id):
+                continue
+
+            created_ms = _created_at_ms(created_at) or timestamp_ms
+            if created_ms > timestamp_ms:
+                timestamp_ms, sequence = created_ms, 0
+            elif sequence < 0xFFF:
+                sequence += 1
+            else:
+                timestamp_ms, sequence = timestamp_ms + 1, 0
+            rekeys.append((message_id, _uuid7_key(timestamp_ms, sequence)))
+
+        if rekeys:
+            conn.exec_driver_sql("INSERT INTO message_rekeys (old_id, new_id) VALUES (?, ?)", rekeys)
+
+    for table, column in MESSAGE_KEY_COLUMNS.items():
+        conn.exec_driver_sql(
+            f"UPDATE {table} SET {column} = (SELECT new_id FROM message_rekeys WHERE old_id = {table}.{column}) "
+            f"WHERE {column} IN (SELECT old_id FROM message_rekeys)"
+        )
+        conn.exec_driver_sql(f"REINDEX {table}")
+
+    conn.exec_driver_sql("DROP TABLE message_rekeys")
+
+def _add_sender_deleted(conn: Connection):
+    _add_column(conn, "messages", "sender_deleted", "BOOLEAN NOT NULL DEFAULT 0")
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_messages_unreachable ON messages (id) "
+        "WHERE sender_id IS NULL OR sender_deleted = 1"
+    )
+
+# Every migration must be safe to run on a database created by create_all with the current
+# models, because fresh databases run the whole list right after creating the tables
+MIGRATIONS: list[Migration] = [
+    Migration(1, "Indexes for inbox, sent, unread count, login lockout and password reset lookups", _create_indexes(
+        "CREATE INDEX IF NOT EXISTS ix_message_recipients_inbox ON message_recipients (recipient_id, is_deleted, message_id)",
+        "CREATE INDEX IF NOT EXISTS ix_message_recipients_unread ON message_recipients (recipient_id, is_deleted, is_read)",
+        "CREATE INDEX IF NOT EXISTS ix_message_recipients_message_id ON message_recipients (message_id)",
+        "CREATE INDEX IF NOT EXISTS ix_messages_sender_id_id ON messages (sender_id, id)",
+        "CREATE INDEX IF NOT EXISTS ix_attachments_message_id ON attachments (message_id)",
+        "CREATE INDEX IF NOT EXISTS ix_login_attempts_email_lockout ON login_attempts (email_attempted, success, created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_login_attempts_ip_lockout ON login_attempts (ip_address, success, created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_password_reset_tokens_token_hash ON password_reset_tokens (token_hash)",
+    )),
+    Migration(2, "Denormalized mailbox counters and per-message recipient/attachment counts", _add_mailbox_counters),
+    Migration(3, "Move message bodies above MESSAGE_BODY_INLINE_MAX_SIZE to message_bodies", _move_large_bodies),
+    Migration(4, "Store ciphertexts, keys and signatures as binary instead of base64/hex text", _convert_to_binary),
+    Migration(5, "Store user, message, attachment and upload ids as 16-byte binary UUIDs", _convert_keys),
+    Migration(6, "Per-user token version for revoking issued tokens", _add_token_version),
+    Migration(7, "Re-key messages created before UUIDv7 ids so new mail sorts first", _rekey_legacy_messages),
+    Migration(8, "Sender-side message deletion and an index of messages their sender cannot see", _add_sender_deleted),
+]
+
+def _ensure_migrations_table(conn: Connection):
+    conn.exec_driver_sql(
+        f"CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} ("
+        "version INTEGER PRIMARY KEY, "
+        "description VARCHAR(255) NOT NULL, "
+        "applied_at DATETIME NOT NULL)"
+    )
+
+def get_applied_versions(conn: Connection) -> set[int]:
+    _ensure_migrations_table(conn)
+    result = conn.exec_driver_sql(f"SELECT version FROM {MIGRATIONS_TABLE}")
+    return {row[0] for row in result}
+
+def run_migrations(conn: Connection) -> list[int]:
+    applied = get_applied_versions(conn)
+    newly_applied = []
+
+    for migration in sorted(MIGRATIONS, key=lambda m: m.version):
+        if migration.version in applied:
+            continue
+
+        logger.info(f"Applying migration {migration.version}: {migration.description}")
+        migration.upgrade(conn)
+        conn.execute(
+            text(f"INSERT INTO {MIGRATIONS_TABLE} (version, description, applied_at) VALUES (:version, :description, :applied_at)"),
+            {
+                "version": migration.version,
+                "description": migration.description,
+                "applied_at": datetime.datetime.now(datetime.timezone.utc)
+            }
+        )
+        newly_applied.append(migration.version)
+
+    return newly_applied
+
+def _hot_queries() -> dict[str, tuple[Select, str]]:
+    from app.models import LoginAttempt, Message, MessageRecipient, PasswordResetToken
+
+    since = datetime.datetime.now(datetime.timezone.utc)
+
+    return {
+        "inbox page": (
+            select(MessageRecipient.id)
+            .where(
+                MessageRecipient.recipient_id == "user",
+                MessageRecipient.is_deleted == False,
+                MessageRecipient.message_id < "cursor"
+            )
+            .order_by(MessageRecipient.message_id.desc())
+            .limit(20),
+            "ix_message_recipients_inbox"
+        ),
+        "unread count": (
+            select(func.count(MessageRecipient.id))
+            .where(
+                MessageRecipient.recipient_id == "user",
+                MessageRecipient.is_read == False,
+                MessageRecipient.is_deleted == False
+            ),
+            "ix_message_recipients_unread"
+        ),
+        "message recipients": (
+            select(MessageRecipient.id).where(MessageRecipient.message_id.in_(["message"])),
+            "ix_message_recipients_message_id"
+        ),
+        "sent page": (
+            select(Message.id)
+            .where(Message.sender_id == "user", Message.sender_deleted == False, Message.id < "cursor")
+            .order_by(Message.id.desc())
+            .limit(20),
+            "ix_messages_sender_id_id"
+        ),
+        "unreachable messages": (
+            select(Message.id)
+            .where(or_(Message.sender_id.is_(None), Message.sender_deleted == True), Message.id > "cursor")
+            .order_by(Message.id)
+            .limit(200),
+            "ix_messages_unreachable"
+        ),
+        "lockout by email": (
+            select(func.count(LoginAttempt.id))
+            .where(and_(
+                LoginAttempt.email_attempted == "user@example.com",
+                LoginAttempt.success == False,
+                LoginAttempt.created_at > since
+            )),
+            "ix_login_attempts_email_lockout"
+        ),
+        "lockout by ip": (
+            select(func.count(LoginAttempt.id))
+            .where(and_(
+                LoginAttempt.ip_address == "127.0.0.1",
+                LoginAttempt.success == False,
+                LoginAttempt.created_at > since
+            )),
+            "ix_login_attempts_ip_lockout"
+        ),
+        "password reset token": (
+            select(PasswordResetToken.id).where(PasswordResetToken.token_hash == "hash"),
+            "ix_password_reset_tokens_token_hash"
+        ),
+    }
+
+def check_query_plans(conn: Connection) -> dict[str, tuple[bool, str]]:
+    results = {}
+
+    for name, (query, expected_index) in _hot_queries().items():
+        compiled = query.compile(dialect=conn.dialect, compile_kwargs={"render_postcompile": True})
+        params = tuple(compiled.params[key] for key in compiled.positiontup or [])
+        rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params).all()
+        plan = "; ".join(str(row[-1]) for row in rows)
+        results[name] = (expected_index in plan, plan)
+
+    return results
+
+async def upgrade():
+    async with engine.begin() as conn:
+        from app.models import users, messages
+
+        await conn.run_sync(Base.metadata.create_all)
+        applied = await conn.run_sync(run_migrations)
+
+    print(f"Applied migrations: {applied}" if applied else "Database is up to date")
+
+async def status():
+    async with engine.begin() as conn:
+        applied = await conn.run_sync(get_applied_versions)
+
+    for migration in sorted(MIGRATIONS, key=lambda m: m.version):
+        state = "applied" if migration.version in applied else "pending"
+        print(f"{migration.version:>4}  {state:<8} {migration.description}")
+
+async def explain() -> bool:
+    async with engine.connect() as conn:
+        results = await conn.run_sync(check_query_plans)
+
+    all_ok = True
+    for name, (ok, plan) in results.items():
+        all_ok = all_ok and ok
+        print(f"[{'OK' if ok else 'MISSING INDEX'}] {name}: {plan}")
+
+    return all_ok
+
+def main():
+    parser = argparse.ArgumentParser(description="Database schema migrations")
+    parser.add_argument("command", choices=["upgrade", "status", "explain"])
+    args = parser.parse_args()
+
+    if args.command == "upgrade":
+        asyncio.run(upgrade())
+    elif args.command == "status":
+        asyncio.run(status())
+    elif not asyncio.run(explain()):
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,16 @@
-from app.models.users import User, LoginAttempt, PasswordResetToken
-from app.models.messages import Message, MessageRecipient, Attachment
+from app.models.users import User, LoginAttempt, PasswordResetToken, RevokedToken
+from app.models.messages import Message, MessageBody, MessageRecipient, Attachment, AttachmentUpload, MailboxCounter
 
 
 __all__ = [
     "User",
     "LoginAttempt",
     "PasswordResetToken",
+    "RevokedToken",
     "Message",
+    "MessageBody",
     "MessageRecipient",
-    "Attachment"
+    "Attachment",
+    "AttachmentUpload",
+    "MailboxCounter"
 ]
@@ -1,31 +1,40 @@
 import datetime
-import uuid
 
 from typing import TYPE_CHECKING
 
-from sqlalchemy import Boolean, DateTime, ForeignKey, Integer, String, Text
+from sqlalchemy import Boolean, DateTime, ForeignKey, Index, Integer, LargeBinary, String, text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
-from app.database import Base
+from app.database import Base, UUIDKey, generate_uuid, generate_uuid7, utcnow
 if TYPE_CHECKING:
     from app.models.users import User
 
 
-def generate_uuid():
-    return str(uuid.uuid4())
-
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        Index("ix_messages_sender_id_id", "sender_id", "id"),
+        # Messages their sender can no longer see, the garbage collector's candidates
+        Index("ix_messages_unreachable", "id", sqlite_where=text("sender_id IS NULL OR sender_deleted = 1")),
+    )
+
+    id: Mapped[str] = mapped_column(UUIDKey, primary_key=True, default=generate_uuid7)
+    sender_id: Mapped[str | None] = mapped_column(UUIDKey, ForeignKey("users.id", ondelete="SET NULL"))
+
+    subject_encrypted: Mapped[bytes] = mapped_column(LargeBinary)
+    # Bodies above MESSAGE_BODY_INLINE_MAX_SIZE bytes live in message_bodies and this column is empty
+    body_encrypted: Mapped[bytes] = mapped_column(LargeBinary)
+    body_external: Mapped[bool] = mapped_column(Boolean, default=False, server_default="0")
 
-    id: Mapped[str] = mapped_column(String(36), primary_key=True, default=generate_uuid)
-    sender_id: Mapped[str | None] = mapped_column(String(36), ForeignKey("users.id", ondelete="SET NULL"))
+    sender_encrypted_key: Mapped[bytes] = mapped_column(LargeBinary)
+    signature: Mapped[bytes] = mapped_column(LargeBinary)
+    created_at: Mapped[datetime.datetime] = mapped_column(DateTime, default=utcnow)
 
-    subject_encrypted: Mapped[str] = mapped_column(Text)
-    body_encrypted: Mapped[str] = mapped_column(Text)
+    # Removed from the sender's Sent list; recipients keep their copies
+    sender_deleted: Mapped[bool] = mapped_column(Boolean, default=False, server_default="0")
 
-    sender_encrypted_key: Mapped[str] = mapped_column(String(128))
-    signature: Mapped[str] = mapped_column(String(128))
-    created_at: Mapped[datetime.datetime] = mapped_column(DateTime, default=datetime.datetime.now(datetime.timezone.utc))
+    recipients_count: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    attachments_count: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
 
     sender: Mapped["User"] = relationship("User", back_populates="sent_messages", foreign_keys=[sender_id])
     recipients: Mapped[list["MessageRecipient"]] = relationship(back_populates="message", cascade="all, delete-orphan")
@@ -34,14 +43,25 @@ class Message(Base):
     def __repr__(self):
         return f"<Message {self.id} from {self.sender_id}>"
 
+class MessageBody(Base):
+    __tablename__ = "message_bodies"
+
+    message_id: Mapped[str] = mapped_column(UUIDKey, ForeignKey("messages.id", ondelete="CASCADE"), primary_key=True)
+    body_encrypted: Mapped[bytes] = mapped_column(LargeBinary)
+
 class MessageRecipient(Base):
     __tablename__ = "message_recipients"
+    __table_args__ = (
+        Index("ix_message_recipients_inbox", "recipient_id", "is_deleted", "message_id"),
+        Index("ix_message_recipients_unread", "recipient_id", "is_deleted", "is_read"),
+        Index("ix_message_recipients_message_id", "message_id"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    message_id: Mapped[str] = mapped_column(String(36), ForeignKey("messages.id", ondelete="CASCADE"))
-    recipient_id: Mapped[str] = mapped_column(String(36), ForeignKey("users.id", ondelete="CASCADE"))
+    message_id: Mapped[str] = mapped_column(UUIDKey, ForeignKey("messages.id", ondelete="CASCADE"))
+    recipient_id: Mapped[str] = mapped_column(UUIDKey, ForeignKey("users.id", ondelete="CASCADE"))
 
-    encrypted_key: Mapped[str] = mapped_column(Text)
+    encrypted_key: Mapped[bytes] = mapped_column(LargeBinary)
 
     is_read: Mapped[bool] = mapped_column(Boolean, default=False)
     read_at: Mapped[datetime.datetime | None] = mapped_column(DateTime)
@@ -53,12 +73,15 @@ class MessageRecipient(Base):
 
 class Attachment(Base):
     __tablename__ = "attachments"
+    __table_args__ = (
+        Index("ix_attachments_message_id", "message_id"),
+    )
 
-    id: Mapped[str] = mapped_column(String(36), primary_key=True, default=generate_uuid)
-    message_id: Mapped[str] = mapped_column(String(36), ForeignKey("messages.id", ondelete="CASCADE"))
+    id: Mapped[str] = mapped_column(UUIDKey, primary_key=True, default=generate_uuid)
+    message_id: Mapped[str] = mapped_column(UUIDKey, ForeignKey("messages.id", ondelete="CASCADE"))
 
-    filename_encrypted: Mapped[str] = mapped_column(Text)
-    mime_type_encrypted: Mapped[str] = mapped_column(Text)
+    filename_encrypted: Mapped[bytes] = mapped_column(LargeBinary)
+    mime_type_encrypted: Mapped[bytes] = mapped_column(LargeBinary)
     size: Mapped[int] = mapped_column(Integer)
 
     storage_path: Mapped[str] = mapped_column(String(500))
@@ -66,9 +89,41 @@ class Attachment(Base):
     encryption_nonce: Mapped[str] = mapped_column(String(32))
     checksum: Mapped[str] = mapped_column(String(64))
 
-    created_at: Mapped[datetime.datetime] = mapped_column(DateTime, default=datetime.datetime.now(datetime.timezone.utc))
+    created_at: Mapped[datetime.datetime] = mapped_column(DateTime, default=utcnow)
 
     message: Mapped["Message"] = relationship(back_populates="attachments")
 
     def __repr__(self):
         return f"<Attachment {self.id} for message {self.message_id}>"
+
+class AttachmentUpload(Base):
+    __tablename__ = "attachment_uploads"
+
+    id: Mapped[str] = mapped_column(UUIDKey, primary_key=True, default=generate_uuid)
+    user_id: Mapped[str] = mapped_column(UUIDKey, ForeignKey("users.id", ondelete="CASCADE"), index=True)
+
+    filename_encrypted: Mapped[bytes] = mapped_column(LargeBinary)
+    mime_type_encrypted: Mapped[bytes] = mapped_column(LargeBinary)
+    size: Mapped[int] = mapped_column(Integer)
+    content_size: Mapped[int] = mapped_column(Integer)
+
+    storage_path: Mapped[str] = mapped_column(String(500))
+
+    encryption_nonce: Mapped[str] = mapped_column(String(32))
+    checksum: Mapped[str] = mapped_column(String(64))
+
+    is_complete: Mapped[bool] = mapped_column(Boolean, default=False)
+    created_at: Mapped[datetime.datetime] = mapped_column(DateTime, default=utcnow)
+    expires_at: Mapped[datetime.datetime] = mapped_column(DateTime)
+
+    def __repr__(self):
+        return f"<AttachmentUpload {self.id} by {self.user_id}>"
+
+class MailboxCounter(Base):
+    __tablename__ = "mailbox_counters"
+
+    user_id: Mapped[str] = mapped_column(UUIDKey, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+
+    inbox_total: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    inbox_unread: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    sent_total: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
@@ -1,23 +1,19 @@
 import datetime
-import uuid
 
 from typing import TYPE_CHECKING
 
-from sqlalchemy import Boolean, DateTime, ForeignKey, Integer, String, Text
+from sqlalchemy import Boolean, DateTime, ForeignKey, Index, Integer, String, Text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
-from app.database import Base
+from app.database import Base, UUIDKey, generate_uuid, utcnow
 if TYPE_CHECKING:
     from app.models.messages import Message, MessageRecipient
 
 
-def generate_uuid():
-    return str(uuid.uuid4())
-
 class User(Base):
     __tablename__ = "users"
 
-    id: Mapped[str] = mapped_column(String(36), primary_key=True, default=generate_uuid)
+    id: Mapped[str] = mapped_column(UUIDKey, primary_key=True, default=generate_uuid)
     email: Mapped[str] = mapped_column(String(255), unique=True, index=True)
     username: Mapped[str] = mapped_column(String(100))
 
@@ -29,9 +25,11 @@ class User(Base):
     totp_backup_codes: Mapped[str | None] = mapped_column(Text)
 
     is_active: Mapped[bool] = mapped_column(Boolean, default=True)
+    # Carried in issued tokens; bumping it rejects every token issued before
+    token_version: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
 
-    created_at: Mapped[datetime.datetime] = mapped_column(DateTime, default=datetime.datetime.now(datetime.timezone.utc))
-    updated_at: Mapped[datetime.datetime] = mapped_column(DateTime, default=datetime.datetime.now(datetime.timezone.utc))
+    created_at: Mapped[datetime.datetime] = mapped_column(DateTime, default=utcnow)
+    updated_at: Mapped[datetime.datetime] = mapped_column(DateTime, default=utcnow)
     last_login: Mapped[datetime.datetime | None] = mapped_column(DateTime)
 
     login_attempts: Mapped[list["LoginAttempt"]] = relationship(back_populates="user", cascade="all, delete-orphan")
@@ -44,9 +42,13 @@ class User(Base):
 
 class LoginAttempt(Base):
     __tablename__ = "login_attempts"
+    __table_args__ = (
+        Index("ix_login_attempts_email_lockout", "email_attempted", "success", "created_at"),
+        Index("ix_login_attempts_ip_lockout", "ip_address", "success", "created_at"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    user_id: Mapped[str | None] = mapped_column(String(36), ForeignKey("users.id", ondelete="SET NULL"))
+    user_id: Mapped[str | None] = mapped_column(UUIDKey, ForeignKey("users.id", ondelete="SET NULL"))
     email_attempted: Mapped[str] = mapped_column(String(255))
     ip_address: Mapped[str] = mapped_column(String(45))
     user_agent: Mapped[str] = mapped_column(String(255))
@@ -54,20 +56,29 @@ class LoginAttempt(Base):
     failure_reason: Mapped[str | None] = mapped_column(String(255))
     is_honeypot: Mapped[bool] = mapped_column(Boolean)
     honeypot_data: Mapped[str | None] = mapped_column(Text)
-    created_at: Mapped[datetime.datetime] = mapped_column(DateTime, default=datetime.datetime.now(datetime.timezone.utc))
+    created_at: Mapped[datetime.datetime] = mapped_column(DateTime, default=utcnow)
 
     user: Mapped["User"] = relationship(back_populates="login_attempts")
 
 class PasswordResetToken(Base):
     __tablename__ = "password_reset_tokens"
+    __table_args__ = (
+        Index("ix_password_reset_tokens_token_hash", "token_hash"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    user_id: Mapped[str] = mapped_column(String(36), ForeignKey("users.id", ondelete="CASCADE"))
+    user_id: Mapped[str] = mapped_column(UUIDKey, ForeignKey("users.id", ondelete="CASCADE"))
 
     token_hash: Mapped[str] = mapped_column(String(255))
     expires_at: Mapped[datetime.datetime] = mapped_column(DateTime)
     used: Mapped[bool] = mapped_column(Boolean, default=False)
     used_at: Mapped[datetime.datetime | None] = mapped_column(DateTime)
-    created_at: Mapped[datetime.datetime] = mapped_column(DateTime, default=datetime.datetime.now(datetime.timezone.utc))
+    created_at: Mapped[datetime.datetime] = mapped_column(DateTime, default=utcnow)
 
     user: Mapped["User"] = relationship(back_populates="password_reset_tokens")
+
+class RevokedToken(Base):
+    __tablename__ = "revoked_tokens"
+
+    jti: Mapped[str] = mapped_column(String(64), primary_key=True)
+    expires_at: Mapped[datetime.datetime] = mapped_column(DateTime, index=True)
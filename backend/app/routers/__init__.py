@@ -1,5 +1,6 @@
 from app.routers.auth import router as auth_router
 from app.routers.users import router as users_router
 from app.routers.messages import router as messages_router
+from app.routers.uploads import router as uploads_router
 
-__all__ = ["auth_router", "users_router", "messages_router"]
+__all__ = ["auth_router", "users_router", "messages_router", "uploads_router"]
@@ -1,8 +1,8 @@
 import datetime
 import json
 
-from app.database import get_db
-from app.middleware import check_honeypot, limiter
+from app.database import get_db, get_read_db, release_connection
+from app.middleware import Tarpitted, check_honeypot, limiter
 from app.middleware.csrf import set_csrf_cookie
 from app.models import PasswordResetToken, User
 from app.routers.dependencies import get_current_user
@@ -11,15 +11,27 @@ from app.config import get_settings
 
 from fastapi import APIRouter, Depends, HTTPException, Request, Response
 
-from sqlalchemy import select
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.services import AuthService, CryptoService, EmailService
+from app.services import AuthService, CryptoService, EmailService, PasswordHashingUnavailable
 
 
 settings = get_settings()
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 
+def set_refresh_cookie(response: Response, refresh_token: str):
+    response.set_cookie(
+        key="refresh_token",
+        value=refresh_token,
+        httponly=True,
+        samesite="strict",
+        secure=settings.ENVIRONMENT == "production",
+        max_age=settings.JWT_REFRESH_TOKEN_EXPIRE_DAYS * 24 * 60 * 60,
+        path="/"
+    )
+
 @router.post("/register", response_model=UserResponse)
 @limiter.limit(settings.RATE_LIMIT_AUTH)
 async def register(request: Request, data: UserCreate, db: AsyncSession = Depends(get_db)):
@@ -37,13 +49,13 @@ async def register(request: Request, data: UserCreate, db: AsyncSession = Depend
         select(User).where(User.email == data.email.lower())
     )
     if result.scalar_one_or_none():
-        await AuthService.apply_failure_delay()
-        raise HTTPException(
+        raise Tarpitted(
             status_code=400,
             detail="Cannot create account with provided data"
         )
     
-    password_hash = CryptoService.hash_password(data.password)
+    await release_connection(db)
+    password_hash = await CryptoService.hash_password_async(data.password)
 
     user = User(
         email=data.email.lower(),
@@ -53,8 +65,17 @@ async def register(request: Request, data: UserCreate, db: AsyncSession = Depend
         is_active=True
     ) # type: ignore[call-arg]
 
+    # The email was checked before hashing without holding the connection, so a concurrent
+    # registration may have taken it since; the unique index decides
     db.add(user)
-    await db.commit()
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise Tarpitted(
+            status_code=400,
+            detail="Cannot create account with provided data"
+        )
     await db.refresh(user)
 
     return UserResponse(
@@ -77,7 +98,7 @@ async def login(request: Request, response: Response, data: UserLogin, db: Async
 
     if check_honeypot(data.model_dump(), request):
         await AuthService.record_login_attempt(
-            db, data.email, client_ip, user_agent,
+            data.email, client_ip, user_agent,
             success=False, failure_reason="honeypot",
             is_honeypot=True, honeypot_data=json.dumps(data.model_dump())
         )
@@ -88,7 +109,7 @@ async def login(request: Request, response: Response, data: UserLogin, db: Async
             expires_in=1800
         ) # type: ignore[call-arg]
     
-    is_locked, remaining = await AuthService.check_login_lockout(db, data.email, client_ip)
+    is_locked, remaining = AuthService.check_login_lockout(data.email, client_ip)
     if is_locked:
         raise HTTPException(
             status_code=429,
@@ -98,24 +119,23 @@ async def login(request: Request, response: Response, data: UserLogin, db: Async
     user = await AuthService.get_user_by_email(db, data.email)
 
     if not user:
-        await AuthService.apply_failure_delay()
         await AuthService.record_login_attempt(
-            db, data.email, client_ip, user_agent,
+            data.email, client_ip, user_agent,
             success=False, failure_reason="user_not_found"
         )
-        raise HTTPException(
+        raise Tarpitted(
             status_code=401,
             detail="Invalid login data"
         )
     
-    if not CryptoService.verify_password(data.password, user.password_hash):
-        await AuthService.apply_failure_delay()
+    await release_connection(db)
+    if not await CryptoService.verify_password_async(data.password, user.password_hash):
         await AuthService.record_login_attempt(
-            db, data.email, client_ip, user_agent,
+            data.email, client_ip, user_agent,
             success=False, failure_reason="invalid_password",
             user_id=user.id
         )
-        raise HTTPException(
+        raise Tarpitted(
             status_code=401,
             detail="Invalid login data"
         )
@@ -130,57 +150,47 @@ async def login(request: Request, response: Response, data: UserLogin, db: Async
         assert(user.totp_secret is not None)
         
         if not AuthService.verify_totp(user.totp_secret, data.totp_code):
+            # The codes are re-read after the password check and consumed with a compare-and-set,
+            # so a backup code sent by two concurrent logins only lets one of them in
+            await db.refresh(user, ["totp_backup_codes"])
+            is_valid = False
             if user.totp_backup_codes:
                 backup_codes = json.loads(user.totp_backup_codes)
                 is_valid, remaining_codes = AuthService.verify_backup_code(
                     backup_codes, data.totp_code
                 )
                 if is_valid:
-                    user.totp_backup_codes = json.dumps(remaining_codes)
-                    await db.commit()
-                else:
-                    await AuthService.apply_failure_delay()
-                    await AuthService.record_login_attempt(
-                        db, data.email, client_ip, user_agent,
-                        success=False, failure_reason="invalid_2fa",
-                        user_id=user.id
-                    )
-                    raise HTTPException(
-                        status_code=401,
-                        detail="Invalid 2FA code"
+                    result = await db.execute(
+                        update(User)
+                        .where(User.id == user.id, User.totp_backup_codes == user.totp_backup_codes)
+                        .values(totp_backup_codes=json.dumps(remaining_codes))
                     )
-            else:
-                await AuthService.apply_failure_delay()
+                    await db.commit()
+                    is_valid = result.rowcount == 1
+
+            if not is_valid:
                 await AuthService.record_login_attempt(
-                    db, data.email, client_ip, user_agent,
+                    data.email, client_ip, user_agent,
                     success=False, failure_reason="invalid_2fa",
                     user_id=user.id
                 )
-                raise HTTPException(
+                raise Tarpitted(
                     status_code=401,
                     detail="Invalid 2FA code"
                 )
     
-    access_token = AuthService.create_access_token(user.id, user.email)
-    refresh_token = AuthService.create_refresh_token(user.id)
+    access_token = AuthService.create_access_token(user.id, user.email, user.token_version)
+    refresh_token = AuthService.create_refresh_token(user.id, user.token_version)
     
     user.last_login = datetime.datetime.now(datetime.timezone.utc)
     await db.commit()
     
     await AuthService.record_login_attempt(
-        db, data.email, client_ip, user_agent,
+        data.email, client_ip, user_agent,
         success=True, user_id=user.id
     )
     
-    response.set_cookie(
-        key="refresh_token",
-        value=refresh_token,
-        httponly=True,
-        samesite="strict",
-        secure=settings.ENVIRONMENT == "production",
-        max_age=settings.JWT_REFRESH_TOKEN_EXPIRE_DAYS * 24 * 60 * 60,
-        path="/"
-    )
+    set_refresh_cookie(response, refresh_token)
     
     set_csrf_cookie(response, user.id)
     
@@ -192,7 +202,19 @@ async def login(request: Request, response: Response, data: UserLogin, db: Async
     )
 
 @router.post("/logout")
-async def logout(response: Response):
+async def logout(request: Request, response: Response, db: AsyncSession = Depends(get_db)):
+    # The presented tokens are revoked, not just forgotten by the browser
+    tokens = [(request.cookies.get("refresh_token"), "refresh")]
+    auth_header = request.headers.get("Authorization")
+    if auth_header and auth_header.startswith("Bearer "):
+        tokens.append((auth_header[7:], "access"))
+
+    for token, token_type in tokens:
+        payload = AuthService.verify_token(token, token_type=token_type) if token else None
+        if payload:
+            await AuthService.revoke_token(db, payload)
+    await db.commit()
+
     response.delete_cookie("refresh_token", path="/")
     response.delete_cookie("csrf_token", path="/")
 
@@ -200,7 +222,7 @@ async def logout(response: Response):
 
 @router.post("/refresh", response_model=TokenResponse)
 @limiter.limit("30/minute")
-async def refresh_token(request: Request, response: Response, db: AsyncSession = Depends(get_db)):
+async def refresh_token(request: Request, response: Response, db: AsyncSession = Depends(get_read_db)):
     refresh_token = request.cookies.get("refresh_token")
 
     if not refresh_token:
@@ -223,18 +245,10 @@ async def refresh_token(request: Request, response: Response, db: AsyncSession =
             detail="User does not exist"
         )
     
-    new_access_token = AuthService.create_access_token(user.id, user.email)
-    new_refresh_token = AuthService.create_refresh_token(user.id)
+    new_access_token = AuthService.create_access_token(user.id, user.email, user.token_version)
+    new_refresh_token = AuthService.create_refresh_token(user.id, user.token_version)
 
-    response.set_cookie(
-        key="refresh_token",
-        value=new_refresh_token,
-        httponly=True,
-        samesite="strict",
-        secure=settings.ENVIRONMENT == "production",
-        max_age=settings.JWT_REFRESH_TOKEN_EXPIRE_DAYS * 24 * 60 * 60,
-        path="/"
-    )
+    set_refresh_cookie(response, new_refresh_token)
     
     return TokenResponse(
         access_token=new_access_token,
@@ -296,8 +310,7 @@ async def verify_2fa(
         )
     
     if not AuthService.verify_totp(current_user.totp_secret, data.code):
-        await AuthService.apply_failure_delay()
-        raise HTTPException(
+        raise Tarpitted(
             status_code=400,
             detail="Invalid code"
         )
@@ -310,6 +323,7 @@ async def verify_2fa(
 @router.post("/2fa/disable")
 async def disable_2fa(
     request: Request,
+    response: Response,
     data: TOTPVerifyRequest,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
@@ -327,14 +341,12 @@ async def disable_2fa(
             backup_codes = json.loads(current_user.totp_backup_codes)
             is_valid, _ = AuthService.verify_backup_code(backup_codes, data.code)
             if not is_valid:
-                await AuthService.apply_failure_delay()
-                raise HTTPException(
+                raise Tarpitted(
                     status_code=400,
                     detail="Invalid code"
                 )
         else:
-            await AuthService.apply_failure_delay()
-            raise HTTPException(
+            raise Tarpitted(
                 status_code=400,
                 detail="Invalid code"
             )
@@ -343,6 +355,9 @@ async def disable_2fa(
     current_user.totp_secret = None
     current_user.totp_backup_codes = None
     await db.commit()
+
+    # Disabling 2FA revoked every issued token; this client gets a refresh token for the new version
+    set_refresh_cookie(response, AuthService.create_refresh_token(current_user.id, current_user.token_version))
     
     return {"message": "2FA has been disabled", "success": True}
 
@@ -403,8 +418,7 @@ async def confirm_password_reset(
     reset_token = result.scalar_one_or_none()
     
     if not reset_token:
-        await AuthService.apply_failure_delay()
-        raise HTTPException(
+        raise Tarpitted(
             status_code=400,
             detail="Invalid or expired token"
         )
@@ -416,13 +430,34 @@ async def confirm_password_reset(
             detail="User does not exist"
         )
     
-    user.password_hash = CryptoService.hash_password(data.new_password)
+    # The token is claimed before hashing, so of two concurrent confirms with the same token
+    # only the one whose UPDATE marks it used goes on to change the password
+    claimed = await db.execute(
+        update(PasswordResetToken)
+        .where(PasswordResetToken.id == reset_token.id, PasswordResetToken.used == False)
+        .values(used=True, used_at=datetime.datetime.now(datetime.timezone.utc))
+    )
+    await release_connection(db)
+    if claimed.rowcount != 1:
+        raise Tarpitted(
+            status_code=400,
+            detail="Invalid or expired token"
+        )
+
+    try:
+        user.password_hash = await CryptoService.hash_password_async(data.new_password)
+    except PasswordHashingUnavailable:
+        # Hand the token back so the reset can be retried once hashing recovers
+        await db.execute(
+            update(PasswordResetToken)
+            .where(PasswordResetToken.id == reset_token.id)
+            .values(used=False, used_at=None)
+        )
+        await db.commit()
+        raise
     
     user.signing_public_key = data.new_signing_public_key
     
-    reset_token.used = True
-    reset_token.used_at = datetime.datetime.now(datetime.timezone.utc)
-    
     await db.commit()
     
     return {
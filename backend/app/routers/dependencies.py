@@ -2,17 +2,17 @@ from fastapi import Depends, HTTPException, Request
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import get_db
+from app.database import get_db, get_read_db
 from app.models import User
 from app.services import AuthService
 
 
 bearer_scheme = HTTPBearer(auto_error=False)
 
-async def get_current_user(
+async def _authenticate(
     request: Request,
-    credentials: HTTPAuthorizationCredentials | None = Depends(bearer_scheme),
-    db: AsyncSession = Depends(get_db)
+    credentials: HTTPAuthorizationCredentials | None,
+    db: AsyncSession
 ) -> User:
     token = None
 
@@ -39,7 +39,7 @@ async def get_current_user(
             headers={"WWW-Authenticate": "Bearer"}
         )
     
-    user = await AuthService.get_user_by_id(db, payload["sub"])
+    user = await AuthService.get_authorized_user(db, payload["sub"])
     
     if not user:
         raise HTTPException(
@@ -54,3 +54,17 @@ async def get_current_user(
         )
     
     return user
+
+async def get_current_user(
+    request: Request,
+    credentials: HTTPAuthorizationCredentials | None = Depends(bearer_scheme),
+    db: AsyncSession = Depends(get_db)
+) -> User:
+    return await _authenticate(request, credentials, db)
+
+async def get_current_user_read(
+    request: Request,
+    credentials: HTTPAuthorizationCredentials | None = Depends(bearer_scheme),
+    db: AsyncSession = Depends(get_read_db)
+) -> User:
+    return await _authenticate(request, credentials, db)
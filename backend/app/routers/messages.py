@@ -1,45 +1,64 @@
-import os
+import asyncio
 import uuid
 import base64
+import binascii
 import datetime
+import json
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from fastapi.responses import StreamingResponse
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
+from sqlalchemy import delete, select
 from sqlalchemy.orm import selectinload
 
-from app.database import get_db
+from app.database import generate_uuid7, get_db, get_read_db, release_connection
 from app.models.users import User
-from app.models.messages import Message, MessageRecipient, Attachment
+from app.models.messages import Message, MessageRecipient, Attachment, AttachmentUpload
 from app.schemas.messages import (
     MessageCreate, MessageResponse, MessageListResponse,
     MessageListItem, RecipientStatus, SenderInfo,
-    MarkMessageRead, MessageDelete, AttachmentResponse
+    MarkMessageRead, MessageDelete, InboxFilter, AttachmentResponse
+)
+from app.routers.dependencies import get_current_user, get_current_user_read
+from app.routers.responses import bytes_response, file_response, make_etag
+from app.routers.wire import wire_body, wire_response
+from app.services import (
+    AttachmentStorage, FileService, MailboxService, MessageService, ZipEntry,
+    bytes_entry, get_storage, iter_zip, zip_size
 )
-from app.routers.dependencies import get_current_user
 from app.config import get_settings
 
 
 settings = get_settings()
 router = APIRouter(prefix="/messages", tags=["Messages"])
 
+def _encode_cursor(message_id: str) -> str:
+    return base64.urlsafe_b64encode(message_id.encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: str) -> str:
+    try:
+        message_id = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        uuid.UUID(message_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return message_id
+
 @router.post("/", response_model=dict)
 async def send_message(
-    data: MessageCreate,
+    data: MessageCreate = Depends(wire_body(MessageCreate)),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     recipient_ids = [r.recipient_id for r in data.recipients]
     
     result = await db.execute(
-        select(User).where(
+        select(User.id).where(
             User.id.in_(recipient_ids),
             User.is_active == True
         )
     )
-    valid_recipients = {u.id for u in result.scalars().all()}
+    valid_recipients = set(result.scalars().all())
     
     invalid_recipients = set(recipient_ids) - valid_recipients
     if invalid_recipients:
@@ -48,71 +67,103 @@ async def send_message(
             detail=f"Invalid recipients: {', '.join(invalid_recipients)}"
         )
     
-    message = Message(
-        sender_id=current_user.id,
-        subject_encrypted=data.subject_encrypted,
-        body_encrypted=data.body_encrypted,
-        signature=data.signature,
-        sender_encrypted_key=data.sender_encrypted_key
-    ) # type: ignore[call-arg]
-    db.add(message)
-    await db.flush()
-    
-    for recipient_data in data.recipients:
-        recipient = MessageRecipient(
-            message_id=message.id,
-            recipient_id=recipient_data.recipient_id,
-            encrypted_key=recipient_data.encrypted_key
-        ) # type: ignore[call-arg]
-        db.add(recipient)
-    
-    if data.attachments:
-        attachments_dir = os.path.join(settings.ATTACHMENTS_DIR, message.id)
-        os.makedirs(attachments_dir, exist_ok=True)
+    uploads: list[AttachmentUpload] = []
+    if data.attachment_upload_ids:
+        result = await db.execute(
+            select(AttachmentUpload).where(
+                AttachmentUpload.id.in_(data.attachment_upload_ids),
+                AttachmentUpload.user_id == current_user.id,
+                AttachmentUpload.is_complete == True,
+                AttachmentUpload.expires_at > datetime.datetime.now(datetime.timezone.utc)
+            )
+        )
+        uploads = list(result.scalars().all())
+        
+        if len(uploads) != len(data.attachment_upload_ids):
+            raise HTTPException(
+                status_code=400,
+                detail="Invalid attachment uploads"
+            )
+    
+    # Attachment files are written without holding the writer connection
+    await release_connection(db)
+
+    message_id = generate_uuid7()
+    attachments = []
+    storage = get_storage()
+    
+    for upload in uploads:
+        storage_path = await storage.put_file(message_id, upload.id, upload.storage_path)
         
-        for att_data in data.attachments:
-            attachment_id = str(uuid.uuid4())
-            file_path = os.path.join(attachments_dir, attachment_id)
-            
-            encrypted_content = base64.b64decode(att_data.content_encrypted)
-            with open(file_path, "wb") as f:
-                f.write(encrypted_content)
-            
-            attachment = Attachment(
-                id=attachment_id,
-                message_id=message.id,
-                filename_encrypted=att_data.filename_encrypted,
-                mime_type_encrypted=att_data.mime_type_encrypted,
-                size=att_data.size,
-                storage_path=file_path,
-                encryption_nonce=att_data.encryption_nonce,
-                checksum=att_data.checksum
-            ) # type: ignore[call-arg]
-            db.add(attachment)
+        attachments.append({
+            "id": upload.id,
+            "filename_encrypted": upload.filename_encrypted,
+            "mime_type_encrypted": upload.mime_type_encrypted,
+            "size": upload.size,
+            "storage_path": storage_path,
+            "encryption_nonce": upload.encryption_nonce,
+            "checksum": upload.checksum
+        })
+    
+    if uploads:
+        await db.execute(
+            delete(AttachmentUpload).where(AttachmentUpload.id.in_([upload.id for upload in uploads]))
+        )
     
+    inline_ids = [str(uuid.uuid4()) for _ in data.attachments or []]
+    storage_paths = await asyncio.gather(*(
+        storage.put(message_id, attachment_id, att_data.content_encrypted)
+        for attachment_id, att_data in zip(inline_ids, data.attachments or [])
+    ))
+    
+    for attachment_id, storage_path, att_data in zip(inline_ids, storage_paths, data.attachments or []):
+        attachments.append({
+            "id": attachment_id,
+            "filename_encrypted": att_data.filename_encrypted,
+            "mime_type_encrypted": att_data.mime_type_encrypted,
+            "size": att_data.size,
+            "storage_path": storage_path,
+            "encryption_nonce": att_data.encryption_nonce,
+            "checksum": att_data.checksum
+        })
+    
+    await MessageService.create_message(db, message_id, current_user.id, data, attachments)
     await db.commit()
     
     return {
-        "message_id": message.id,
+        "message_id": message_id,
         "recipients_count": len(data.recipients),
-        "attachments_count": len(data.attachments) if data.attachments else 0
+        "attachments_count": len(attachments)
     }
 
 @router.get("/inbox", response_model=MessageListResponse)
 async def get_inbox(
+    request: Request,
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=100),
     unread_only: bool = Query(False),
-    current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    cursor: str | None = Query(None, description="Opaque cursor returned as next_cursor"),
+    current_user: User = Depends(get_current_user_read),
+    db: AsyncSession = Depends(get_read_db)
 ):
+    # Only the columns rendered in the list are selected, so message bodies and the
+    # recipient/attachment collections are never loaded
     base_query = (
-        select(MessageRecipient)
-        .options(
-            selectinload(MessageRecipient.message).selectinload(Message.sender),
-            selectinload(MessageRecipient.message).selectinload(Message.attachments),
-            selectinload(MessageRecipient.message).selectinload(Message.recipients)
+        select(
+            MessageRecipient.message_id,
+            MessageRecipient.encrypted_key,
+            MessageRecipient.is_read,
+            Message.subject_encrypted,
+            Message.created_at,
+            User.id.label("sender_id"),
+            User.username.label("sender_username"),
+            User.email.label("sender_email"),
+            User.signing_public_key.label("sender_signing_public_key"),
+            Message.attachments_count,
+            Message.recipients_count
         )
+        .join(Message, Message.id == MessageRecipient.message_id)
+        .outerjoin(User, User.id == Message.sender_id)
         .where(
             MessageRecipient.recipient_id == current_user.id,
             MessageRecipient.is_deleted == False
@@ -122,125 +173,162 @@ async def get_inbox(
     if unread_only:
         base_query = base_query.where(MessageRecipient.is_read == False)
     
-    count_result = await db.execute(
-        select(func.count(MessageRecipient.id))
-        .where(
-            MessageRecipient.recipient_id == current_user.id,
-            MessageRecipient.is_deleted == False
-        )
-    )
-    total = count_result.scalar() or 0
+    total = (await MailboxService.get_counters(db, current_user.id)).inbox_total
     
-    offset = (page - 1) * page_size
+    # Message ids are time-ordered, so ordering by them is chronological and a cursor
+    # turns every page into a range scan instead of an OFFSET skip
+    if cursor:
+        base_query = base_query.where(MessageRecipient.message_id < _decode_cursor(cursor))
+    else:
+        base_query = base_query.offset((page - 1) * page_size)
+
     result = await db.execute(
         base_query
         .order_by(MessageRecipient.message_id.desc())
-        .offset(offset)
-        .limit(page_size)
+        .limit(page_size + 1)
     )
     
-    recipients = result.scalars().all()
+    rows = result.all()
+    next_cursor = _encode_cursor(rows[page_size - 1].message_id) if len(rows) > page_size else None
+    rows = rows[:page_size]
     
     messages = []
-    for mr in recipients:
-        msg = mr.message
-        sender = msg.sender
-        
+    for row in rows:
         sender_info = None
-        if sender:
+        if row.sender_id:
             sender_info = SenderInfo(
-                id=sender.id,
-                username=sender.username,
-                email=sender.email,
-                signing_public_key=sender.signing_public_key
+                id=row.sender_id,
+                username=row.sender_username,
+                email=row.sender_email,
+                signing_public_key=row.sender_signing_public_key
             )
         
         messages.append(MessageListItem(
-            id=msg.id,
+            id=row.message_id,
             sender=sender_info,
-            subject_encrypted=msg.subject_encrypted,
-            encrypted_key=mr.encrypted_key,
-            has_attachments=len(msg.attachments) > 0,
-            attachments_count=len(msg.attachments),
-            recipients_count=len(msg.recipients),
-            created_at=msg.created_at,
-            is_read=mr.is_read
+            subject_encrypted=row.subject_encrypted,
+            encrypted_key=row.encrypted_key,
+            has_attachments=row.attachments_count > 0,
+            attachments_count=row.attachments_count,
+            recipients_count=row.recipients_count,
+            created_at=row.created_at,
+            is_read=row.is_read
         ))
     
     total_pages = (total + page_size - 1) // page_size
     
-    return MessageListResponse(
+    return wire_response(request, MessageListResponse(
         messages=messages,
         total=total,
         page=page,
         page_size=page_size,
-        total_pages=total_pages
-    )
+        total_pages=total_pages,
+        next_cursor=next_cursor
+    ))
 
 @router.get("/sent", response_model=MessageListResponse)
 async def get_sent(
+    request: Request,
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=100),
-    current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    cursor: str | None = Query(None, description="Opaque cursor returned as next_cursor"),
+    current_user: User = Depends(get_current_user_read),
+    db: AsyncSession = Depends(get_read_db)
 ):
-    count_result = await db.execute(
-        select(func.count(Message.id))
-        .where(Message.sender_id == current_user.id)
+    total = (await MailboxService.get_counters(db, current_user.id)).sent_total
+    
+    query = (
+        select(
+            Message.id,
+            Message.subject_encrypted,
+            Message.sender_encrypted_key,
+            Message.created_at,
+            Message.attachments_count,
+            Message.recipients_count
+        )
+        .where(Message.sender_id == current_user.id, Message.sender_deleted == False)
     )
-    total = count_result.scalar() or 0
-    
-    offset = (page - 1) * page_size
+
+    if cursor:
+        query = query.where(Message.id < _decode_cursor(cursor))
+    else:
+        query = query.offset((page - 1) * page_size)
+
     result = await db.execute(
-        select(Message)
-        .options(
-            selectinload(Message.attachments),
-            selectinload(Message.recipients).selectinload(MessageRecipient.recipient)
-        )
-        .where(Message.sender_id == current_user.id)
-        .order_by(Message.created_at.desc())
-        .offset(offset)
-        .limit(page_size)
+        query
+        .order_by(Message.id.desc())
+        .limit(page_size + 1)
     )
     
-    db_messages = result.scalars().all()
+    rows = result.all()
+    next_cursor = _encode_cursor(rows[page_size - 1].id) if len(rows) > page_size else None
+    rows = rows[:page_size]
     
+    sender_info = SenderInfo(
+        id=current_user.id,
+        username=current_user.username,
+        email=current_user.email,
+        signing_public_key=current_user.signing_public_key
+    )
+
     messages = []
-    for msg in db_messages:
-        sender_info = SenderInfo(
-            id=current_user.id,
-            username=current_user.username,
-            email=current_user.email,
-            signing_public_key=current_user.signing_public_key
-        )
-        
+    for row in rows:
         messages.append(MessageListItem(
-            id=msg.id,
+            id=row.id,
             sender=sender_info,
-            subject_encrypted=msg.subject_encrypted,
-            encrypted_key=msg.sender_encrypted_key or "",
-            has_attachments=len(msg.attachments) > 0,
-            attachments_count=len(msg.attachments),
-            recipients_count=len(msg.recipients),
-            created_at=msg.created_at,
+            subject_encrypted=row.subject_encrypted,
+            encrypted_key=row.sender_encrypted_key or "",
+            has_attachments=row.attachments_count > 0,
+            attachments_count=row.attachments_count,
+            recipients_count=row.recipients_count,
+            created_at=row.created_at,
             is_read=True
         ))
     
     total_pages = (total + page_size - 1) // page_size
     
-    return MessageListResponse(
+    return wire_response(request, MessageListResponse(
         messages=messages,
         total=total,
         page=page,
         page_size=page_size,
-        total_pages=total_pages
+        total_pages=total_pages,
+        next_cursor=next_cursor
+    ))
+
+async def _get_accessible_message(
+    db: AsyncSession,
+    message_id: str,
+    current_user: User
+) -> tuple[Message, MessageRecipient | None]:
+    result = await db.execute(
+        select(Message)
+        .options(selectinload(Message.recipients))
+        .where(Message.id == message_id)
     )
+    message = result.scalar_one_or_none()
+    
+    if not message:
+        raise HTTPException(status_code=404, detail="Message not found")
+    
+    is_sender = message.sender_id == current_user.id
+    recipient_record = next((mr for mr in message.recipients if mr.recipient_id == current_user.id), None)
+    
+    if not is_sender and not recipient_record:
+        raise HTTPException(status_code=403, detail="No access")
+    
+    if message.sender_deleted and not recipient_record:
+        raise HTTPException(status_code=404, detail="Message has been deleted")
+    
+    return message, recipient_record
 
 @router.get("/{message_id}", response_model=MessageResponse)
 async def get_message(
+    request: Request,
     message_id: str,
-    current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    include_body: bool = Query(True),
+    current_user: User = Depends(get_current_user_read),
+    db: AsyncSession = Depends(get_read_db)
 ):
     result = await db.execute(
         select(Message)
@@ -267,10 +355,10 @@ async def get_message(
     if not is_sender and not recipient_record:
         raise HTTPException(status_code=403, detail="No access to message")
     
-    if recipient_record and recipient_record.is_deleted:
+    if (recipient_record and recipient_record.is_deleted) or (message.sender_deleted and not recipient_record):
         raise HTTPException(status_code=404, detail="Message has been deleted")
     
-    encrypted_key = ""
+    encrypted_key = b""
     if recipient_record:
         encrypted_key = recipient_record.encrypted_key
     elif is_sender and message.sender_encrypted_key:
@@ -308,11 +396,11 @@ async def get_message(
         for att in message.attachments
     ]
     
-    return MessageResponse(
+    return wire_response(request, MessageResponse(
         id=message.id,
         sender=sender_info,
         subject_encrypted=message.subject_encrypted,
-        body_encrypted=message.body_encrypted,
+        body_encrypted=await MessageService.get_body(db, message) if include_body else None,
         signature=message.signature,
         encrypted_key=encrypted_key,
         attachments=attachments,
@@ -320,7 +408,23 @@ async def get_message(
         created_at=message.created_at,
         is_read=recipient_record.is_read if recipient_record else True,
         read_at=recipient_record.read_at if recipient_record else None
-    )
+    ))
+
+@router.get("/{message_id}/body")
+async def get_message_body(
+    request: Request,
+    message_id: str,
+    current_user: User = Depends(get_current_user_read),
+    db: AsyncSession = Depends(get_read_db)
+):
+    message, recipient_record = await _get_accessible_message(db, message_id, current_user)
+    
+    if recipient_record and recipient_record.is_deleted:
+        raise HTTPException(status_code=404, detail="Message has been deleted")
+    
+    body = await MessageService.get_body(db, message)
+    
+    return bytes_response(request, body, make_etag(message.id, message.signature.hex()))
 
 @router.put("/mark-read")
 async def mark_messages_read(
@@ -328,25 +432,7 @@ async def mark_messages_read(
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    result = await db.execute(
-        select(MessageRecipient)
-        .where(
-            MessageRecipient.message_id.in_(data.message_ids),
-            MessageRecipient.recipient_id == current_user.id,
-            MessageRecipient.is_deleted == False
-        )
-    )
-    
-    recipients = result.scalars().all()
-    updated = 0
-    
-    for mr in recipients:
-        if not mr.is_read:
-            mr.is_read = True
-            mr.read_at = datetime.datetime.now(datetime.timezone.utc)
-            updated += 1
-    
-    await db.commit()
+    updated = await MailboxService.mark_read(db, current_user.id, message_ids=data.message_ids)
     
     return {"updated": updated}
 
@@ -356,49 +442,99 @@ async def delete_messages(
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    result = await db.execute(
-        select(MessageRecipient)
-        .where(
-            MessageRecipient.message_id.in_(data.message_ids),
-            MessageRecipient.recipient_id == current_user.id
-        )
-    )
+    deleted = await MailboxService.delete(db, current_user.id, message_ids=data.message_ids)
     
-    recipients = result.scalars().all()
-    deleted = 0
-    
-    for mr in recipients:
-        if not mr.is_deleted:
-            mr.is_deleted = True
-            mr.deleted_at = datetime.datetime.now(datetime.timezone.utc)
-            deleted += 1
+    return {"deleted": deleted}
+
+@router.put("/inbox/mark-read")
+async def mark_inbox_read(
+    data: InboxFilter,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    updated = await MailboxService.mark_read(db, current_user.id, before=data.before)
     
-    await db.commit()
+    return {"updated": updated}
+
+@router.delete("/inbox")
+async def delete_inbox_messages(
+    data: InboxFilter,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    deleted = await MailboxService.delete(db, current_user.id, before=data.before)
     
     return {"deleted": deleted}
 
-@router.get("/{message_id}/attachments/{attachment_id}")
-async def get_attachment(
-    message_id: str,
-    attachment_id: str,
+@router.delete("/sent")
+async def delete_sent_messages(
+    data: MessageDelete,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
+    deleted = await MailboxService.delete_sent(db, current_user.id, data.message_ids)
+    
+    return {"deleted": deleted}
+
+@router.get("/{message_id}/attachments")
+async def get_attachments_archive(
+    message_id: str,
+    current_user: User = Depends(get_current_user_read),
+    db: AsyncSession = Depends(get_read_db)
+):
+    await _get_accessible_message(db, message_id, current_user)
+    
     result = await db.execute(
-        select(Message)
-        .options(selectinload(Message.recipients))
-        .where(Message.id == message_id)
+        select(Attachment)
+        .where(Attachment.message_id == message_id)
+        .order_by(Attachment.created_at, Attachment.id)
     )
-    message = result.scalar_one_or_none()
+    attachments = list(result.scalars().all())
     
-    if not message:
-        raise HTTPException(status_code=404, detail="Message not found")
+    if not attachments:
+        raise HTTPException(status_code=404, detail="Message has no attachments")
     
-    is_sender = message.sender_id == current_user.id
-    is_recipient = any(mr.recipient_id == current_user.id for mr in message.recipients)
+    entries = []
+    manifest = []
+    for attachment in attachments:
+        blob = await AttachmentStorage.locate(attachment.storage_path)
+        if blob is None:
+            raise HTTPException(status_code=404, detail="Attachment file not found")
+        
+        entries.append(ZipEntry(
+            attachment.id,
+            blob.length,
+            FileService.iter_file(blob.path, start=blob.offset, end=blob.offset + blob.length - 1)
+        ))
+        manifest.append(AttachmentResponse(
+            id=attachment.id,
+            filename_encrypted=attachment.filename_encrypted,
+            mime_type_encrypted=attachment.mime_type_encrypted,
+            size=attachment.size,
+            encryption_nonce=attachment.encryption_nonce,
+            checksum=attachment.checksum
+        ).model_dump(mode="json"))
     
-    if not is_sender and not is_recipient:
-        raise HTTPException(status_code=403, detail="No access")
+    entries.append(bytes_entry("manifest.json", json.dumps({"message_id": message_id, "attachments": manifest}).encode()))
+    
+    return StreamingResponse(
+        iter_zip(entries, datetime.datetime.now(datetime.timezone.utc)),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": f"attachment; filename={message_id}.zip",
+            "Content-Length": str(zip_size(entries))
+        }
+    )
+
+@router.get("/{message_id}/attachments/{attachment_id}")
+async def get_attachment(
+    request: Request,
+    message_id: str,
+    attachment_id: str,
+    current_user: User = Depends(get_current_user_read),
+    db: AsyncSession = Depends(get_read_db)
+):
+    await _get_accessible_message(db, message_id, current_user)
     
     result = await db.execute(
         select(Attachment)
@@ -414,17 +550,14 @@ async def get_attachment(
     
     assert isinstance(attachment, Attachment)
 
-    if not os.path.exists(attachment.storage_path):
+    blob = await AttachmentStorage.locate(attachment.storage_path)
+    if blob is None:
         raise HTTPException(status_code=404, detail="Attachment file not found")
-    
-    def iterfile():
-        with open(attachment.storage_path, "rb") as f:
-            while chunk := f.read(8192):
-                yield chunk
-    
-    return StreamingResponse(
-        iterfile(),
-        media_type="application/octet-stream",
+
+    return file_response(
+        request,
+        blob,
+        make_etag(attachment.id, attachment.checksum),
         headers={
             "Content-Disposition": f"attachment; filename={attachment_id}",
             "X-Encryption-Nonce": attachment.encryption_nonce,
@@ -435,17 +568,9 @@ async def get_attachment(
 
 @router.get("/unread/count")
 async def get_unread_count(
-    current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    current_user: User = Depends(get_current_user_read),
+    db: AsyncSession = Depends(get_read_db)
 ):
-    result = await db.execute(
-        select(func.count(MessageRecipient.id))
-        .where(
-            MessageRecipient.recipient_id == current_user.id,
-            MessageRecipient.is_read == False,
-            MessageRecipient.is_deleted == False
-        )
-    )
-    count = result.scalar() or 0
+    counters = await MailboxService.get_counters(db, current_user.id)
     
-    return {"unread_count": count}
+    return {"unread_count": counters.inbox_unread}
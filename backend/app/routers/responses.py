@@ -0,0 +1,92 @@
+import hashlib
+
+from fastapi import Request, Response
+from fastapi.responses import StreamingResponse
+
+from app.services import FileService, RangeNotSatisfiable, StoredBlob, parse_range
+
+
+def make_etag(*parts: str) -> str:
+    return '"' + hashlib.sha256(":".join(parts).encode()).hexdigest()[:32] + '"'
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    return any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
+def _negotiate(
+    request: Request,
+    size: int,
+    etag: str,
+    headers: dict[str, str] | None
+) -> Response | tuple[int, int, int, dict[str, str]]:
+    # Served content never changes once written, so a strong ETag lets clients revalidate with
+    # If-None-Match (304, no body) and resume with Range/If-Range (206, only the missing bytes).
+    # Returns the finished 304/416 response, or the status, inclusive byte span and headers.
+    headers = {
+        **(headers or {}),
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, no-cache"
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    if not if_range or if_range.strip() == etag:
+        try:
+            byte_range = parse_range(request.headers.get("range"), size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+
+    if byte_range is None:
+        return 200, 0, size - 1, {**headers, "Content-Length": str(size)}
+
+    start, end = byte_range
+    return 206, start, end, {
+        **headers,
+        "Content-Range": f"bytes {start}-{end}/{size}",
+        "Content-Length": str(end - start + 1)
+    }
+
+def file_response(
+    request: Request,
+    blob: StoredBlob,
+    etag: str,
+    media_type: str = "application/octet-stream",
+    headers: dict[str, str] | None = None
+) -> Response:
+    negotiated = _negotiate(request, blob.length, etag, headers)
+    if isinstance(negotiated, Response):
+        return negotiated
+
+    status_code, start, end, headers = negotiated
+    return StreamingResponse(
+        FileService.iter_file(blob.path, start=blob.offset + start, end=blob.offset + end),
+        status_code=status_code,
+        media_type=media_type,
+        headers=headers
+    )
+
+def bytes_response(
+    request: Request,
+    data: bytes,
+    etag: str,
+    media_type: str = "application/octet-stream",
+    headers: dict[str, str] | None = None
+) -> Response:
+    negotiated = _negotiate(request, len(data), etag, headers)
+    if isinstance(negotiated, Response):
+        return negotiated
+
+    status_code, start, end, headers = negotiated
+    return Response(
+        content=data[start:end + 1],
+        status_code=status_code,
+        media_type=media_type,
+        headers=headers
+    )
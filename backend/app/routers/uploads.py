@@ -0,0 +1,156 @@
+import asyncio
+import datetime
+import os
+import weakref
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import generate_uuid, get_db, get_read_db
+from app.models.users import User
+from app.models.messages import AttachmentUpload
+from app.schemas.messages import AttachmentUploadCreate, AttachmentUploadResponse
+from app.routers.dependencies import get_current_user, get_current_user_read
+from app.services import FileService, FileSizeExceeded
+from app.config import get_settings
+
+
+settings = get_settings()
+router = APIRouter(prefix="/uploads", tags=["Uploads"])
+
+# Serializes the offset check and append of chunks to the same upload. Entries disappear once
+# no request holds the lock; the app runs as a single worker so a process-local lock suffices
+_upload_locks: weakref.WeakValueDictionary[str, asyncio.Lock] = weakref.WeakValueDictionary()
+
+def _upload_lock(upload_id: str) -> asyncio.Lock:
+    lock = _upload_locks.get(upload_id)
+    if lock is None:
+        lock = _upload_locks[upload_id] = asyncio.Lock()
+    return lock
+
+async def _upload_response(upload: AttachmentUpload) -> AttachmentUploadResponse:
+    return AttachmentUploadResponse(
+        id=upload.id,
+        content_size=upload.content_size,
+        received=await FileService.getsize(upload.storage_path),
+        is_complete=upload.is_complete,
+        expires_at=upload.expires_at
+    )
+
+async def _get_upload(db: AsyncSession, upload_id: str, user: User) -> AttachmentUpload:
+    result = await db.execute(
+        select(AttachmentUpload).where(
+            AttachmentUpload.id == upload_id,
+            AttachmentUpload.user_id == user.id,
+            AttachmentUpload.expires_at > datetime.datetime.now(datetime.timezone.utc)
+        )
+    )
+    upload = result.scalar_one_or_none()
+
+    if not upload:
+        raise HTTPException(status_code=404, detail="Upload not found")
+
+    return upload
+
+@router.post("/", response_model=AttachmentUploadResponse)
+async def create_upload(
+    data: AttachmentUploadCreate,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    upload_id = generate_uuid()
+    await FileService.makedirs(settings.ATTACHMENT_UPLOADS_DIR)
+
+    upload = AttachmentUpload(
+        id=upload_id,
+        user_id=current_user.id,
+        filename_encrypted=data.filename_encrypted,
+        mime_type_encrypted=data.mime_type_encrypted,
+        size=data.size,
+        content_size=data.content_size,
+        storage_path=os.path.join(settings.ATTACHMENT_UPLOADS_DIR, upload_id),
+        encryption_nonce=data.encryption_nonce,
+        checksum=data.checksum,
+        expires_at=datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=settings.ATTACHMENT_UPLOAD_EXPIRE_HOURS)
+    ) # type: ignore[call-arg]
+    db.add(upload)
+
+    await FileService.touch(upload.storage_path)
+    await db.commit()
+
+    return await _upload_response(upload)
+
+@router.get("/{upload_id}", response_model=AttachmentUploadResponse)
+async def get_upload(
+    upload_id: str,
+    current_user: User = Depends(get_current_user_read),
+    db: AsyncSession = Depends(get_read_db)
+):
+    upload = await _get_upload(db, upload_id, current_user)
+
+    return await _upload_response(upload)
+
+@router.put("/{upload_id}", response_model=AttachmentUploadResponse)
+async def upload_chunk(
+    upload_id: str,
+    request: Request,
+    offset: int = Query(..., ge=0, description="Byte offset of this chunk, must equal the received size"),
+    current_user: User = Depends(get_current_user_read),
+    db: AsyncSession = Depends(get_read_db)
+):
+    # Progress is the size of the staged file, so chunks are streamed to disk without
+    # holding a write connection and an interrupted upload resumes from what was stored
+    upload = await _get_upload(db, upload_id, current_user)
+
+    if upload.is_complete:
+        raise HTTPException(status_code=409, detail="Upload has already been finalized")
+
+    async with _upload_lock(upload.id):
+        received = await FileService.getsize(upload.storage_path)
+        if offset != received:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Upload offset mismatch, expected {received}",
+                headers={"Upload-Offset": str(received)}
+            )
+
+        try:
+            await FileService.write_stream(upload.storage_path, offset, upload.content_size, request.stream())
+        except FileSizeExceeded:
+            raise HTTPException(status_code=413, detail="Chunk exceeds declared content size")
+
+    return await _upload_response(upload)
+
+@router.post("/{upload_id}/finalize", response_model=AttachmentUploadResponse)
+async def finalize_upload(
+    upload_id: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    upload = await _get_upload(db, upload_id, current_user)
+
+    async with _upload_lock(upload.id):
+        if await FileService.getsize(upload.storage_path) != upload.content_size:
+            raise HTTPException(status_code=400, detail="Upload is incomplete")
+
+        upload.is_complete = True
+        await db.commit()
+
+    return await _upload_response(upload)
+
+@router.delete("/{upload_id}")
+async def abort_upload(
+    upload_id: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    upload = await _get_upload(db, upload_id, current_user)
+
+    await db.execute(delete(AttachmentUpload).where(AttachmentUpload.id == upload.id))
+    await db.commit()
+
+    await FileService.remove(upload.storage_path)
+
+    return {"deleted": True}
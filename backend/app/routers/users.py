@@ -1,17 +1,19 @@
 from typing import List
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, or_
 
-from app.database import get_db
+from app.database import get_db, get_read_db, release_connection
 from app.models.users import User
 from app.schemas.users import (
     UserResponse, UserPublicKey, PasswordChangeRequest
 )
+from app.services import AuthService
 from app.services.crypto import CryptoService
-from app.routers.dependencies import get_current_user
+from app.routers.auth import set_refresh_cookie
+from app.routers.dependencies import get_current_user, get_current_user_read
 from app.config import get_settings
 
 
@@ -20,7 +22,7 @@ router = APIRouter(prefix="/users", tags=["Users"])
 
 @router.get("/me", response_model=UserResponse)
 async def get_current_user_profile(
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user_read)
 ):
     return UserResponse(
         id=current_user.id,
@@ -34,11 +36,13 @@ async def get_current_user_profile(
 
 @router.post("/me/change-password")
 async def change_password(
+    response: Response,
     data: PasswordChangeRequest,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    if not CryptoService.verify_password(data.current_password, current_user.password_hash):
+    await release_connection(db)
+    if not await CryptoService.verify_password_async(data.current_password, current_user.password_hash):
         raise HTTPException(
             status_code=400,
             detail="Invalid current password"
@@ -50,10 +54,13 @@ async def change_password(
             detail="New password must be different from the current one"
         )
     
-    current_user.password_hash = CryptoService.hash_password(data.new_password)
+    current_user.password_hash = await CryptoService.hash_password_async(data.new_password)
     current_user.signing_public_key = data.new_signing_public_key
     
     await db.commit()
+
+    # The password change revoked every issued token; this client gets a refresh token for the new version
+    set_refresh_cookie(response, AuthService.create_refresh_token(current_user.id, current_user.token_version))
     
     return {"message": "Password has been changed"}
 
@@ -61,8 +68,8 @@ async def change_password(
 async def search_users(
     q: str = Query(..., min_length=2, max_length=100, description="Search query"),
     limit: int = Query(10, ge=1, le=50),
-    current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    current_user: User = Depends(get_current_user_read),
+    db: AsyncSession = Depends(get_read_db)
 ):
     search_term = f"%{q.lower()}%"
     
@@ -94,8 +101,8 @@ async def search_users(
 @router.get("/{user_id}/public-key", response_model=UserPublicKey)
 async def get_user_public_key(
     user_id: str,
-    current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    current_user: User = Depends(get_current_user_read),
+    db: AsyncSession = Depends(get_read_db)
 ):
     result = await db.execute(
         select(User).where(
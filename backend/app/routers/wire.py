@@ -0,0 +1,84 @@
+import datetime
+
+from typing import Any, Callable, Coroutine, TypeVar
+
+import msgpack
+
+from fastapi import HTTPException, Request, Response
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, ValidationError
+
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+def _encode_default(value: Any) -> Any:
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot encode {type(value).__name__} as MessagePack")
+
+def _accepted_media_types(accept: str) -> dict[str, float]:
+    # Media range -> q-value of an Accept header; ranges with a malformed q are ignored
+    accepted: dict[str, float] = {}
+    for media_range in accept.split(","):
+        media_type, *params = [part.strip() for part in media_range.split(";")]
+        if not media_type:
+            continue
+
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = -1.0
+
+        if 0.0 <= quality <= 1.0:
+            accepted[media_type.lower()] = max(quality, accepted.get(media_type.lower(), 0.0))
+    return accepted
+
+def wants_msgpack(request: Request) -> bool:
+    # MessagePack is opt-in: it has to be named explicitly with a non-zero q-value at least
+    # that of JSON, so wildcards alone keep the JSON default
+    accepted = _accepted_media_types(request.headers.get("accept", ""))
+    msgpack_quality = max(accepted.get(media_type, 0.0) for media_type in MSGPACK_MEDIA_TYPES)
+    json_quality = max(accepted.get(media_type, 0.0) for media_type in ("application/json", "application/*", "*/*"))
+    return msgpack_quality > 0 and msgpack_quality >= json_quality
+
+def wire_body(model: type[ModelT]) -> Callable[[Request], Coroutine[Any, Any, ModelT]]:
+    # Dependency that accepts the model as JSON (default) or MessagePack, selected by
+    # Content-Type. MessagePack payloads carry the schemas' byte fields as raw bytes.
+    async def parse(request: Request) -> ModelT:
+        content_type = request.headers.get("content-type", "").split(";")[0].strip()
+        body = await request.body()
+
+        try:
+            if content_type not in MSGPACK_MEDIA_TYPES:
+                return model.model_validate_json(body)
+
+            try:
+                payload = msgpack.unpackb(body, raw=False)
+            except (ValueError, TypeError, msgpack.UnpackException):
+                raise HTTPException(status_code=400, detail="Malformed MessagePack body")
+            return model.model_validate(payload)
+        except ValidationError as e:
+            # Inputs are left out: they may be raw bytes, and echoing ciphertexts back is wasteful
+            raise RequestValidationError([
+                {**error, "loc": ("body", *error["loc"])}
+                for error in e.errors(include_url=False, include_input=False)
+            ])
+
+    return parse
+
+def wire_response(request: Request, data: BaseModel) -> Response:
+    # JSON unless the client accepts MessagePack. Both variants carry Vary: Accept, so a cache
+    # never hands one format to a client that negotiated the other
+    headers = {"Vary": "Accept"}
+    if not wants_msgpack(request):
+        return Response(content=data.model_dump_json(), media_type="application/json", headers=headers)
+
+    # Python-mode dumps keep Base64Bytes fields as bytes, which MessagePack packs as bin
+    content = msgpack.packb(data.model_dump(), default=_encode_default)
+    return Response(content=content, media_type=MSGPACK_MEDIA_TYPES[0], headers=headers)
@@ -16,6 +16,8 @@ from app.schemas.messages import (
     MessageListResponse,
     AttachmentCreate,
     AttachmentResponse,
+    AttachmentUploadCreate,
+    AttachmentUploadResponse,
     RecipientStatus,
 )
 
@@ -35,5 +37,7 @@ __all__ = [
     "MessageListResponse",
     "AttachmentCreate",
     "AttachmentResponse",
+    "AttachmentUploadCreate",
+    "AttachmentUploadResponse",
     "RecipientStatus",
 ]
@@ -1,17 +1,55 @@
+import base64
+import binascii
 import datetime
 
-from pydantic import BaseModel, Field, field_validator
+from typing import Annotated, Any
+
+from pydantic import BaseModel, BeforeValidator, Field, PlainSerializer, WithJsonSchema, field_validator, model_validator
+
+
+def _decode_base64(value: Any) -> Any:
+    if not isinstance(value, str):
+        return value
+    try:
+        return base64.b64decode(value, validate=True)
+    except binascii.Error:
+        raise ValueError("Invalid base64")
+
+def _decode_hex(value: Any) -> Any:
+    if not isinstance(value, str):
+        return value
+    try:
+        return bytes.fromhex(value)
+    except ValueError:
+        raise ValueError("Invalid hex")
+
+# Ciphertexts, keys and signatures are bytes inside the app and in the database. JSON carries
+# them as base64 (hex for signatures); binary encodings such as MessagePack carry raw bytes,
+# which is why Base64Bytes only turns into a string when dumped in JSON mode.
+Base64Bytes = Annotated[
+    bytes,
+    BeforeValidator(_decode_base64),
+    PlainSerializer(lambda value: base64.b64encode(value).decode(), return_type=str, when_used="json"),
+    WithJsonSchema({"type": "string", "format": "base64"})
+]
+
+HexBytes = Annotated[
+    bytes,
+    BeforeValidator(_decode_hex),
+    PlainSerializer(lambda value: value.hex(), return_type=str, when_used="json"),
+    WithJsonSchema({"type": "string", "format": "hex"})
+]
 
 
 class AttachmentCreate(BaseModel):
-    filename_encrypted: str = Field(
+    filename_encrypted: Base64Bytes = Field(
         ...,
-        max_length=1000,
+        max_length=750, # 1000 characters of base64
         description="Base64 of attachment's encrypted filename"
     )
-    mime_type_encrypted: str = Field(
+    mime_type_encrypted: Base64Bytes = Field(
         ...,
-        max_length=500,
+        max_length=375, # 500 characters of base64
         description="Base64 of attachment's encrypted MIME type"
     )
     size: int = Field(
@@ -20,7 +58,7 @@ class AttachmentCreate(BaseModel):
         lt=25 * 1024 * 1024, # 25MB
         description="Size of the original attachment"
     )
-    content_encrypted: str = Field(
+    content_encrypted: Base64Bytes = Field(
         ...,
         description="Base64 of encrypted file's content"
     )
@@ -37,31 +75,74 @@ class AttachmentCreate(BaseModel):
         description="SHA-256 hash of the original attachment (hex)"
     )
 
+class AttachmentUploadCreate(BaseModel):
+    filename_encrypted: Base64Bytes = Field(
+        ...,
+        max_length=750, # 1000 characters of base64
+        description="Base64 of attachment's encrypted filename"
+    )
+    mime_type_encrypted: Base64Bytes = Field(
+        ...,
+        max_length=375, # 500 characters of base64
+        description="Base64 of attachment's encrypted MIME type"
+    )
+    size: int = Field(
+        ...,
+        gt=0,
+        lt=25 * 1024 * 1024, # 25MB
+        description="Size of the original attachment"
+    )
+    content_size: int = Field(
+        ...,
+        gt=0,
+        le=25 * 1024 * 1024 + 1024, # 25MB plus encryption overhead
+        description="Size of the encrypted content that will be uploaded (bytes)"
+    )
+    encryption_nonce: str = Field(
+        ...,
+        min_length=24,
+        max_length=32,
+        description="Nonce used for encryption (hex)"
+    )
+    checksum: str = Field(
+        ...,
+        min_length=64,
+        max_length=64,
+        description="SHA-256 hash of the original attachment (hex)"
+    )
+
+class AttachmentUploadResponse(BaseModel):
+    id: str
+    content_size: int
+    received: int
+    is_complete: bool
+    expires_at: datetime.datetime
+
 class RecipientKey(BaseModel):
     recipient_id: str = Field(
         ...,
         description="Id of the recipient"
     )
-    encrypted_key: str = Field(
+    encrypted_key: Base64Bytes = Field(
         ...,
         description="Base64 of AES key encrypted using RSA-OAEP"
     )
 
 class MessageCreate(BaseModel):
-    subject_encrypted: str = Field(
+    subject_encrypted: Base64Bytes = Field(
         ...,
-        max_length=1000,
+        max_length=750, # 1000 characters of base64
         description="Base64 of encrypted message's subject"
     )
-    body_encrypted: str = Field(
+    body_encrypted: Base64Bytes = Field(
         ...,
-        max_length=1000000, # ~750KB after base64
+        max_length=750000, # ~750KB, 1000000 characters of base64
         description="Base64 of encrypted message's body"
     )
-    signature: str = Field(
+    signature: HexBytes = Field(
         ...,
-        min_length=128,
-        max_length=128,
+        min_length=64,
+        max_length=64,
         description="Ed25519 signature of the message (hex)"
     )
     recipients: list[RecipientKey] = Field(
@@ -70,7 +151,7 @@ class MessageCreate(BaseModel):
         max_length=50,
         description="List of recipients and their encrypted keys"
     )
-    sender_encrypted_key: str = Field(
+    sender_encrypted_key: Base64Bytes = Field(
         ...,
         description="Base64 of sender's encrypted key for read purposes"
     )
@@ -79,6 +160,11 @@ class MessageCreate(BaseModel):
         max_length = 10,
         description="List of attachments"
     )
+    attachment_upload_ids: list[str] | None = Field(
+        None,
+        max_length=10,
+        description="Ids of finalized attachment uploads"
+    )
 
     @field_validator("recipients")
     @classmethod
@@ -88,11 +174,20 @@ class MessageCreate(BaseModel):
             raise ValueError("Duplicate recipient Ids found")
         return v
 
+    @model_validator(mode="after")
+    def validate_attachments_count(self) -> "MessageCreate":
+        upload_ids = self.attachment_upload_ids or []
+        if len(upload_ids) != len(set(upload_ids)):
+            raise ValueError("Duplicate attachment upload Ids found")
+        if len(self.attachments or []) + len(upload_ids) > 10:
+            raise ValueError("Too many attachments")
+        return self
+
 class AttachmentResponse(BaseModel):
     id: str
 
-    filename_encrypted: str
-    mime_type_encrypted: str
+    filename_encrypted: Base64Bytes
+    mime_type_encrypted: Base64Bytes
     size: int
 
     encryption_nonce: str
@@ -119,11 +214,11 @@ class MessageResponse(BaseModel):
     id: str
     sender: SenderInfo | None = None
 
-    subject_encrypted: str
-    body_encrypted: str
-    signature: str
+    subject_encrypted: Base64Bytes
+    body_encrypted: Base64Bytes | None = None
+    signature: HexBytes
     
-    encrypted_key: str
+    encrypted_key: Base64Bytes
 
     attachments: list[AttachmentResponse] = []
     recipients: list[RecipientStatus] = []
@@ -139,9 +234,9 @@ class MessageListItem(BaseModel):
     id:str
     sender: SenderInfo | None = None
 
-    subject_encrypted: str
+    subject_encrypted: Base64Bytes
 
-    encrypted_key: str
+    encrypted_key: Base64Bytes
 
     has_attachments: bool
     attachments_count: int
@@ -159,12 +254,13 @@ class MessageListResponse(BaseModel):
     page: int
     page_size: int
     total_pages: int
+    next_cursor: str | None = None
 
 class MarkMessageRead(BaseModel):
     message_ids: list[str] = Field(
         ...,
         min_length=1,
-        max_length=100,
+        max_length=5000,
         description="List of message ids to mark as read"
     )
 
@@ -172,6 +268,12 @@ class MessageDelete(BaseModel):
     message_ids: list[str] = Field(
         ..., 
         min_length=1, 
-        max_length=100,
+        max_length=5000,
         description="List of message ids to delete"
     )
+
+class InboxFilter(BaseModel):
+    before: datetime.datetime | None = Field(
+        None,
+        description="Only affect messages created before this time (whole inbox if omitted)"
+    )
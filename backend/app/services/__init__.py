@@ -1,5 +1,14 @@
-from app.services.crypto import CryptoService
+from app.services.archive import ZipEntry, bytes_entry, iter_zip, zip_size
+from app.services.audit import AuditService
+from app.services.cache import ExpiringSet, SlidingWindowCounter, TTLCache
+from app.services.crypto import CryptoService, PasswordHashingUnavailable
 from app.services.auth import AuthService
 from app.services.email import EmailService
+from app.services.files import FileService, FileSizeExceeded, RangeNotSatisfiable, parse_range
+from app.services.jwt_backend import InvalidToken, JWTBackend, get_jwt_backend
+from app.services.mailbox import MailboxService
+from app.services.messages import MessageService
+from app.services.storage import AttachmentStorage, PackedStorage, StoredBlob, get_storage
+from app.services.sweeper import SweeperService, SweepReport
 
-__all__ = ["CryptoService", "AuthService", "EmailService"]
+__all__ = ["ZipEntry", "bytes_entry", "iter_zip", "zip_size", "AuditService", "ExpiringSet", "SlidingWindowCounter", "TTLCache", "CryptoService", "PasswordHashingUnavailable", "AuthService", "EmailService", "FileService", "FileSizeExceeded", "RangeNotSatisfiable", "parse_range", "InvalidToken", "JWTBackend", "get_jwt_backend", "MailboxService", "MessageService", "AttachmentStorage", "PackedStorage", "StoredBlob", "get_storage", "SweeperService", "SweepReport"]
@@ -0,0 +1,80 @@
+import datetime
+import struct
+import zlib
+
+from typing import AsyncIterable, AsyncIterator, NamedTuple
+
+
+LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+DATA_DESCRIPTOR = struct.Struct("<IIII")
+CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+END_OF_CENTRAL_DIRECTORY = struct.Struct("<IHHHHIIH")
+
+ZIP_VERSION = 20
+FLAG_DATA_DESCRIPTOR = 0x08
+FLAG_UTF8 = 0x800
+
+class ZipEntry(NamedTuple):
+    name: str
+    size: int
+    chunks: AsyncIterable[bytes]
+
+async def _single_chunk(data: bytes) -> AsyncIterator[bytes]:
+    yield data
+
+def bytes_entry(name: str, data: bytes) -> ZipEntry:
+    return ZipEntry(name, len(data), _single_chunk(data))
+
+def _dos_datetime(value: datetime.datetime) -> tuple[int, int]:
+    value = max(value, datetime.datetime(1980, 1, 1, tzinfo=value.tzinfo))
+    time = value.hour << 11 | value.minute << 5 | value.second // 2
+    date = (value.year - 1980) << 9 | value.month << 5 | value.day
+    return time, date
+
+def zip_size(entries: list[ZipEntry]) -> int:
+    total = END_OF_CENTRAL_DIRECTORY.size
+    for entry in entries:
+        name_length = len(entry.name.encode())
+        total += LOCAL_HEADER.size + name_length + entry.size + DATA_DESCRIPTOR.size
+        total += CENTRAL_HEADER.size + name_length
+    return total
+
+async def iter_zip(entries: list[ZipEntry], modified: datetime.datetime) -> AsyncIterator[bytes]:
+    # Store-only (no compression) ZIP written front to back: sizes and CRCs follow each entry in
+    # a data descriptor, so nothing is buffered beyond the current chunk and the archive length
+    # is known up front (zip_size). Entries are limited to the classic 4 GiB format.
+    dos_time, dos_date = _dos_datetime(modified)
+    flags = FLAG_DATA_DESCRIPTOR | FLAG_UTF8
+    central_directory = []
+    offset = 0
+
+    for entry in entries:
+        name = entry.name.encode()
+        header = LOCAL_HEADER.pack(
+            0x04034B50, ZIP_VERSION, flags, 0, dos_time, dos_date, 0, 0, 0, len(name), 0
+        ) + name
+        yield header
+
+        crc = 0
+        size = 0
+        async for chunk in entry.chunks:
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            yield chunk
+
+        if size != entry.size:
+            raise ValueError(f"ZIP entry {entry.name} is {size} bytes, expected {entry.size}")
+
+        yield DATA_DESCRIPTOR.pack(0x08074B50, crc, size, size)
+
+        central_directory.append(CENTRAL_HEADER.pack(
+            0x02014B50, ZIP_VERSION, ZIP_VERSION, flags, 0, dos_time, dos_date,
+            crc, size, size, len(name), 0, 0, 0, 0, 0, offset
+        ) + name)
+        offset += len(header) + size + DATA_DESCRIPTOR.size
+
+    directory = b"".join(central_directory)
+    yield directory
+    yield END_OF_CENTRAL_DIRECTORY.pack(
+        0x06054B50, 0, 0, len(entries), len(entries), len(directory), offset, 0
+    )
@@ -0,0 +1,80 @@
+import asyncio
+import datetime
+import logging
+
+from sqlalchemy import insert
+
+from app.config import get_settings
+from app.database import async_session_maker
+from app.models import LoginAttempt
+
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+class AuditService:
+    # Login attempts are queued by the request and inserted by one background task, in
+    # transactions of up to AUDIT_BATCH_SIZE rows at most every AUDIT_FLUSH_INTERVAL seconds.
+    # A None on the queue tells the writer to flush everything left and stop.
+    _queue: asyncio.Queue | None = None
+    _writer: asyncio.Task | None = None
+
+    @staticmethod
+    def start():
+        if AuditService._writer is None:
+            AuditService._queue = asyncio.Queue(maxsize=settings.AUDIT_QUEUE_MAX_SIZE)
+            AuditService._writer = asyncio.create_task(AuditService._run(AuditService._queue))
+
+    @staticmethod
+    async def stop():
+        if AuditService._writer is None or AuditService._queue is None:
+            return
+
+        queue, writer = AuditService._queue, AuditService._writer
+        AuditService._queue = AuditService._writer = None
+        await queue.put(None)
+        await writer
+
+    @staticmethod
+    async def record_login_attempt(**values):
+        values["created_at"] = datetime.datetime.now(datetime.timezone.utc)
+
+        if AuditService._queue is None:
+            # No writer running (e.g. outside the app's lifespan): write right away
+            await AuditService._write([values])
+            return
+
+        # Waits for room when the writer falls behind instead of dropping audit rows
+        await AuditService._queue.put(values)
+
+    @staticmethod
+    async def _write(rows: list[dict]):
+        try:
+            async with async_session_maker() as session:
+                await session.execute(insert(LoginAttempt), rows)
+                await session.commit()
+        except Exception:
+            logger.exception(f"Failed to write {len(rows)} login attempts")
+
+    @staticmethod
+    async def _run(queue: asyncio.Queue):
+        batch_size = settings.AUDIT_BATCH_SIZE
+
+        while True:
+            rows = [await queue.get()]
+            if rows[0] is not None and queue.qsize() + 1 < batch_size:
+                await asyncio.sleep(settings.AUDIT_FLUSH_INTERVAL)
+            while len(rows) < batch_size and not queue.empty():
+                rows.append(queue.get_nowait())
+
+            stopping = None in rows
+            if stopping:
+                while not queue.empty():
+                    rows.append(queue.get_nowait())
+            rows = [row for row in rows if row is not None]
+
+            for start in range(0, len(rows), batch_size):
+                await AuditService._write(rows[start:start + batch_size])
+
+            if stopping:
+                return
@@ -1,26 +1,89 @@
-import asyncio
 import base64
 import datetime
+import hashlib
 import qrcode
 import pyotp
+import secrets
+import time
 
 from io import BytesIO
 
-from jose import JWTError, jwt
-
-from sqlalchemy import and_, func, select
+from sqlalchemy import and_, event, inspect, select
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, make_transient_to_detached
 
 from app.config import get_settings
-from app.models import LoginAttempt, User
+from app.models import LoginAttempt, RevokedToken, User
 from app.services import CryptoService
+from app.services.audit import AuditService
+from app.services.cache import ExpiringSet, SlidingWindowCounter, TTLCache
+from app.services.jwt_backend import InvalidToken, get_jwt_backend
 
 
 settings = get_settings()
 
+# Detached copies of active users, keyed by id, so authenticated requests skip the user query
+user_cache: TTLCache[User] = TTLCache(settings.USER_CACHE_SIZE, settings.USER_CACHE_TTL_SECONDS)
+
+# Verified claims keyed by the token's SHA-256, kept until the token expires, so a token is
+# only parsed and its signature checked once per process
+token_cache: TTLCache[dict] = TTLCache(settings.TOKEN_CACHE_SIZE, settings.JWT_ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+
+# Failed logins per email and per IP within LOGIN_LOCKOUT_MINUTES, which check_login_lockout
+# consults instead of counting login_attempts rows. Rebuilt at startup by load_login_failures.
+failed_logins_by_email = SlidingWindowCounter(settings.LOGIN_LOCKOUT_MINUTES * 60, settings.MAX_LOGIN_ATTEMPTS)
+failed_logins_by_ip = SlidingWindowCounter(settings.LOGIN_LOCKOUT_MINUTES * 60, settings.MAX_LOGIN_ATTEMPTS)
+
+# Tokens are checked without the database: token_versions holds the current version of every
+# user whose version was ever bumped (everyone else is at 0), revoked_tokens the ids of tokens
+# revoked at logout until they expire. Both are loaded at startup by load_token_state.
+token_versions: dict[str, int] = {}
+revoked_tokens = ExpiringSet()
+
+def _detached_copy(user: User) -> User:
+    # The session's own instance is handed to the request, which may modify it
+    copy = User(**{attr.key: getattr(user, attr.key) for attr in inspect(User).column_attrs}) # type: ignore[call-arg]
+    make_transient_to_detached(copy)
+    return copy
+
+def _was_disabled(user: User, key: str) -> bool:
+    history = inspect(user).attrs[key].history
+    return bool(history.deleted and history.deleted[0]) and history.added == [False]
+
+@event.listens_for(Session, "before_flush")
+def _bump_token_versions(session: Session, flush_context, instances):
+    # A password change or reset, deactivation or disabling 2FA rejects every token issued
+    # to the user before it
+    for obj in session.dirty:
+        if isinstance(obj, User) and (
+            inspect(obj).attrs.password_hash.history.has_changes()
+            or _was_disabled(obj, "is_active")
+            or _was_disabled(obj, "totp_enabled")
+        ):
+            obj.token_version = (obj.token_version or 0) + 1
+
+@event.listens_for(Session, "after_flush")
+def _collect_changed_users(session: Session, flush_context):
+    # Any ORM change to a user (password, 2FA, reset, deactivation, last login) drops its
+    # cache entry once committed, so a re-read never sees the pre-commit row
+    changed = {obj.id: obj.token_version for obj in (*session.dirty, *session.deleted) if isinstance(obj, User)}
+    if changed:
+        session.info.setdefault("changed_users", {}).update(changed)
+
+@event.listens_for(Session, "after_commit")
+def _apply_changed_users(session: Session):
+    for user_id, token_version in session.info.pop("changed_users", {}).items():
+        user_cache.invalidate(user_id)
+        if token_version:
+            token_versions[user_id] = token_version
+
+@event.listens_for(Session, "after_soft_rollback")
+def _forget_changed_users(session: Session, previous_transaction):
+    session.info.pop("changed_users", None)
+
 class AuthService:
     @staticmethod
-    def create_access_token(user_id: str, email: str) -> str:
+    def create_access_token(user_id: str, email: str, token_version: int = 0) -> str:
         expire = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(minutes=settings.JWT_ACCESS_TOKEN_EXPIRE_MINUTES)
 
         payload = {
@@ -28,36 +91,76 @@ class AuthService:
             "email": email,
             "exp": expire,
             "iat": datetime.datetime.now(datetime.timezone.utc),
-            "type": "access"
+            "type": "access",
+            "ver": token_version,
+            "jti": secrets.token_urlsafe(16)
         }
 
-        return jwt.encode(payload, settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALGORITHM)
+        return get_jwt_backend().encode(payload)
     
     @staticmethod
-    def create_refresh_token(user_id: str) -> str:
+    def create_refresh_token(user_id: str, token_version: int = 0) -> str:
         expire = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=settings.JWT_REFRESH_TOKEN_EXPIRE_DAYS)
 
         payload = {
             "sub": user_id,
             "exp": expire,
             "iat": datetime.datetime.now(datetime.timezone.utc),
-            "type": "refresh"
+            "type": "refresh",
+            "ver": token_version,
+            "jti": secrets.token_urlsafe(16)
         }
 
-        return jwt.encode(payload, settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALGORITHM)
+        return get_jwt_backend().encode(payload)
     
     @staticmethod
     def verify_token(token: str, token_type: str = "access") -> dict | None:
-        try:
-            payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
+        key = hashlib.sha256(token.encode()).digest()
+        payload = token_cache.get(key)
 
-            if payload["type"] != token_type:
+        if payload is None:
+            try:
+                payload = get_jwt_backend().decode(token)
+            except InvalidToken:
                 return None
-            
-            return payload
-        except JWTError:
+            if "exp" in payload:
+                token_cache.set(key, payload, ttl=payload["exp"] - time.time())
+
+        # Type, revocation and version are checked on every use, cached or not
+        if payload.get("type") != token_type:
+            return None
+
+        if payload.get("jti") in revoked_tokens:
             return None
+
+        if payload.get("ver", 0) < token_versions.get(payload.get("sub"), 0):
+            return None
+
+        return payload
     
+    @staticmethod
+    async def revoke_token(db: AsyncSession, payload: dict):
+        # Rejected until the time it would have expired anyway; the row only matters on restart
+        if "jti" not in payload:
+            return
+
+        expires_at = datetime.datetime.fromtimestamp(payload["exp"], datetime.timezone.utc)
+        await db.merge(RevokedToken(jti=payload["jti"], expires_at=expires_at)) # type: ignore[call-arg]
+        revoked_tokens.add(payload["jti"], payload["exp"])
+
+    @staticmethod
+    async def load_token_state(db: AsyncSession):
+        result = await db.execute(select(User.id, User.token_version).where(User.token_version > 0))
+        token_versions.clear()
+        token_versions.update({user_id: token_version for user_id, token_version in result.all()})
+
+        result = await db.execute(
+            select(RevokedToken.jti, RevokedToken.expires_at)
+            .where(RevokedToken.expires_at > datetime.datetime.now(datetime.timezone.utc))
+        )
+        for jti, expires_at in result.all():
+            revoked_tokens.add(jti, expires_at.replace(tzinfo=datetime.timezone.utc).timestamp())
+
     @staticmethod
     def generate_totp_secret() -> str:
         return pyotp.random_base32()
@@ -112,32 +215,9 @@ class AuthService:
         return False, None
     
     @staticmethod
-    async def check_login_lockout(db: AsyncSession, email: str, ip_address: str) -> tuple[bool, int]:
-        lockout_time = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(minutes=settings.LOGIN_LOCKOUT_MINUTES)
-
-        result = await db.execute(
-            select(func.count(LoginAttempt.id))
-            .where(
-                and_(
-                    LoginAttempt.email_attempted == email,
-                    LoginAttempt.success == False,
-                    LoginAttempt.created_at > lockout_time
-                )
-            )
-        )
-        email_attempts = result.scalar() or 0
-
-        result = await db.execute(
-            select(func.count(LoginAttempt.id))
-            .where(
-                and_(
-                    LoginAttempt.ip_address == ip_address,
-                    LoginAttempt.success == False,
-                    LoginAttempt.created_at > lockout_time
-                )
-            )
-        )
-        ip_attempts = result.scalar() or 0
+    def check_login_lockout(email: str, ip_address: str) -> tuple[bool, int]:
+        email_attempts = failed_logins_by_email.count(email)
+        ip_attempts = failed_logins_by_ip.count(ip_address)
 
         max_attempts = max(email_attempts, ip_attempts)
 
@@ -145,10 +225,26 @@ class AuthService:
             return True, 0
         
         return False, settings.MAX_LOGIN_ATTEMPTS - max_attempts
+
+    @staticmethod
+    async def load_login_failures(db: AsyncSession):
+        # Rebuilds the lockout counters from the failures still inside the window
+        since = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(minutes=settings.LOGIN_LOCKOUT_MINUTES)
+        result = await db.execute(
+            select(LoginAttempt.email_attempted, LoginAttempt.ip_address, LoginAttempt.created_at)
+            .where(LoginAttempt.success == False, LoginAttempt.created_at > since)
+            .order_by(LoginAttempt.created_at)
+        )
+
+        failed_logins_by_email.clear()
+        failed_logins_by_ip.clear()
+        for email, ip_address, created_at in result.all():
+            timestamp = created_at.replace(tzinfo=datetime.timezone.utc).timestamp()
+            failed_logins_by_email.add(email, timestamp)
+            failed_logins_by_ip.add(ip_address, timestamp)
     
     @staticmethod
     async def record_login_attempt(
-        db: AsyncSession,
         email: str,
         ip_address: str,
         user_agent: str,
@@ -158,7 +254,12 @@ class AuthService:
         is_honeypot: bool = False,
         honeypot_data: str | None = None
     ):
-        attempt = LoginAttempt(
+        # Lockout counters are updated at once; the row itself is written by AuditService
+        if not success:
+            failed_logins_by_email.add(email)
+            failed_logins_by_ip.add(ip_address)
+
+        await AuditService.record_login_attempt(
             user_id=user_id,
             email_attempted=email,
             ip_address=ip_address,
@@ -167,13 +268,7 @@ class AuthService:
             failure_reason=failure_reason,
             is_honeypot=is_honeypot,
             honeypot_data=honeypot_data
-        ) # type: ignore[call-arg]
-        db.add(attempt)
-        await db.commit()
-    
-    @staticmethod
-    async def apply_failure_delay():
-        await asyncio.sleep(settings.AUTH_FAILURE_DELAY)
+        )
     
     @staticmethod
     async def get_user_by_email(db: AsyncSession, email: str) -> User | None:
@@ -197,4 +292,30 @@ class AuthService:
                 )
             )
         )
-        return result.scalar_one_or_none()    
+        return result.scalar_one_or_none()
+
+    @staticmethod
+    async def get_authorized_user(db: AsyncSession, user_id: str) -> User | None:
+        # get_user_by_id through user_cache. A hit is merged into the request's session without
+        # a query, so routes can still modify and commit the user they are given.
+        if not settings.USER_CACHE_ENABLED:
+            return await AuthService.get_user_by_id(db, user_id)
+
+        cached = user_cache.get(user_id)
+        if cached is not None:
+            return await db.merge(cached, load=False)
+
+        user = await AuthService.get_user_by_id(db, user_id)
+        if user is not None:
+            user_cache.set(user_id, _detached_copy(user))
+        return user
+
+    @staticmethod
+    def cache_stats() -> dict[str, dict[str, int]]:
+        return {
+            "users": user_cache.stats(),
+            "decoded_tokens": token_cache.stats(),
+            "tokens": {"revoked": len(revoked_tokens), "versioned_users": len(token_versions)},
+            "login_failures": {"emails": len(failed_logins_by_email), "ips": len(failed_logins_by_ip)}
+        }
+
@@ -0,0 +1,115 @@
+import collections
+import heapq
+import time
+
+from typing import Generic, Hashable, TypeVar
+
+
+ValueT = TypeVar("ValueT")
+
+class TTLCache(Generic[ValueT]):
+    # Bounded mapping whose entries expire ttl seconds after being set. Past max_size the least
+    # recently used entry is evicted. Only touched from the event loop, so there is no locking.
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: collections.OrderedDict[Hashable, tuple[float, ValueT]] = collections.OrderedDict()
+
+    def get(self, key: Hashable) -> ValueT | None:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: Hashable, value: ValueT, ttl: float | None = None):
+        if self.max_size <= 0:
+            return
+        self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict[str, int]:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+class ExpiringSet:
+    # Set of keys that each drop out at their own expiry (a time.time() timestamp). Expired
+    # keys are evicted from a heap as new ones are added, so membership stays O(1).
+    def __init__(self):
+        self._expiries: dict[Hashable, float] = {}
+        self._heap: list[tuple[float, Hashable]] = []
+
+    def add(self, key: Hashable, expires_at: float):
+        self.evict_expired()
+        if expires_at <= time.time():
+            return
+        self._expiries[key] = max(expires_at, self._expiries.get(key, 0))
+        heapq.heappush(self._heap, (expires_at, key))
+
+    def evict_expired(self):
+        now = time.time()
+        while self._heap and self._heap[0][0] <= now:
+            expires_at, key = heapq.heappop(self._heap)
+            if self._expiries.get(key) == expires_at:
+                del self._expiries[key]
+
+    def __contains__(self, key: Hashable) -> bool:
+        expires_at = self._expiries.get(key)
+        return expires_at is not None and expires_at > time.time()
+
+    def __len__(self) -> int:
+        return len(self._expiries)
+
+class SlidingWindowCounter:
+    # Events per key within the last window seconds. Only the latest max_events of a key are
+    # kept, so a count is exact up to max_events. Keys are ordered by their latest event, and
+    # keys whose events have all aged out are dropped from the front as new events arrive.
+    def __init__(self, window: float, max_events: int):
+        self.window = window
+        self.max_events = max_events
+        self._events: collections.OrderedDict[Hashable, collections.deque[float]] = collections.OrderedDict()
+
+    def add(self, key: Hashable, timestamp: float | None = None):
+        now = time.time()
+        events = self._events.get(key)
+        if events is None:
+            events = self._events[key] = collections.deque(maxlen=self.max_events)
+        events.append(now if timestamp is None else timestamp)
+        self._events.move_to_end(key)
+
+        cutoff = now - self.window
+        while self._events:
+            oldest = next(iter(self._events.values()))
+            if oldest and oldest[-1] > cutoff:
+                break
+            self._events.popitem(last=False)
+
+    def count(self, key: Hashable) -> int:
+        events = self._events.get(key)
+        if not events:
+            return 0
+
+        cutoff = time.time() - self.window
+        while events and events[0] <= cutoff:
+            events.popleft()
+        return len(events)
+
+    def clear(self):
+        self._events.clear()
+
+    def __len__(self) -> int:
+        return len(self._events)
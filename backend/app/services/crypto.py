@@ -1,6 +1,11 @@
+import asyncio
+import contextlib
 import hashlib
+import multiprocessing
 import secrets
 
+from concurrent.futures import ProcessPoolExecutor
+
 from app.config import get_settings
 
 from passlib.context import CryptContext
@@ -8,6 +13,15 @@ from passlib.context import CryptContext
 
 settings = get_settings()
 
+class PasswordHashingUnavailable(Exception):
+    pass
+
+def _hash_password(password: str) -> str:
+    return CryptoService.hash_password(password)
+
+def _verify_password(password: str, password_hash: str) -> bool:
+    return CryptoService.verify_password(password, password_hash)
+
 class CryptoService:
     pwd_context = CryptContext(
         schemes=["argon2"],
@@ -19,6 +33,52 @@ class CryptoService:
         argon2__salt_len=settings.ARGON2_SALT_LENGTH,
     )
 
+    _hash_pool: ProcessPoolExecutor | None = None
+    _hash_pending: int = 0
+
+    @staticmethod
+    def start_hash_pool() -> None:
+        if CryptoService._hash_pool is None:
+            CryptoService._hash_pool = ProcessPoolExecutor(
+                max_workers=settings.PASSWORD_HASH_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+
+    @staticmethod
+    def shutdown_hash_pool() -> None:
+        if CryptoService._hash_pool is not None:
+            CryptoService._hash_pool.shutdown(wait=True, cancel_futures=True)
+            CryptoService._hash_pool = None
+
+    @staticmethod
+    async def _run_in_hash_pool(func, *args):
+        if CryptoService._hash_pending >= settings.PASSWORD_HASH_MAX_QUEUE:
+            raise PasswordHashingUnavailable("Password hashing queue is full")
+
+        CryptoService.start_hash_pool()
+        assert CryptoService._hash_pool is not None
+
+        # A job that times out keeps running in the pool, so it stays counted until the pool
+        # reports it finished rather than until this call gives up on it
+        loop = asyncio.get_running_loop()
+        future = CryptoService._hash_pool.submit(func, *args)
+        CryptoService._hash_pending += 1
+        future.add_done_callback(lambda _: CryptoService._hash_job_done(loop))
+
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=settings.PASSWORD_HASH_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise PasswordHashingUnavailable("Password hashing timed out")
+
+    @staticmethod
+    def _hash_job_done(loop: asyncio.AbstractEventLoop):
+        # Called from the pool's management thread
+        def release():
+            CryptoService._hash_pending -= 1
+
+        with contextlib.suppress(RuntimeError):
+            loop.call_soon_threadsafe(release)
+
     @staticmethod
     def hash_password(password: str) -> str:
         return CryptoService.pwd_context.hash(password)
@@ -29,6 +89,14 @@ class CryptoService:
             return CryptoService.pwd_context.verify(password, password_hash)
         except Exception:
             return False
+
+    @staticmethod
+    async def hash_password_async(password: str) -> str:
+        return await CryptoService._run_in_hash_pool(_hash_password, password)
+
+    @staticmethod
+    async def verify_password_async(password: str, password_hash: str) -> bool:
+        return await CryptoService._run_in_hash_pool(_verify_password, password, password_hash)
     
     @staticmethod
     def generate_secure_token(length: int = 32) -> str:
@@ -0,0 +1,156 @@
+import asyncio
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterable, AsyncIterator, Callable, TypeVar
+
+from app.config import get_settings
+
+
+settings = get_settings()
+
+T = TypeVar("T")
+
+class FileSizeExceeded(Exception):
+    pass
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+def parse_range(header: str | None, size: int) -> tuple[int, int] | None:
+    # Returns the inclusive (start, end) of a single "bytes=" range, or None when the header is
+    # absent, malformed or asks for several ranges, in which case the whole file is served
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+
+    first, sep, last = header[len("bytes="):].strip().partition("-")
+    if not sep or not (first or last):
+        return None
+    if (first and not first.isdigit()) or (last and not last.isdigit()):
+        return None
+
+    if not first:
+        length = int(last)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable()
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    end = int(last) if last else size - 1
+    if last and end < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable()
+    return start, min(end, size - 1)
+
+def _read_at(fd: int, length: int, offset: int) -> bytes:
+    return os.pread(fd, length, offset)
+
+class FileService:
+    # Attachment I/O gets its own pool so large transfers never queue behind (or starve)
+    # the default executor used by the database driver and other to_thread calls
+    _executor: ThreadPoolExecutor | None = None
+
+    @staticmethod
+    def _get_executor() -> ThreadPoolExecutor:
+        if FileService._executor is None:
+            FileService._executor = ThreadPoolExecutor(
+                max_workers=settings.ATTACHMENT_IO_WORKERS,
+                thread_name_prefix="attachment-io"
+            )
+        return FileService._executor
+
+    @staticmethod
+    def shutdown():
+        if FileService._executor is not None:
+            FileService._executor.shutdown(wait=True)
+            FileService._executor = None
+
+    @staticmethod
+    async def run(func: Callable[..., T], *args) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(FileService._get_executor(), func, *args)
+
+    @staticmethod
+    async def makedirs(path: str):
+        await FileService.run(lambda: os.makedirs(path, exist_ok=True))
+
+    @staticmethod
+    async def exists(path: str) -> bool:
+        return await FileService.run(os.path.exists, path)
+
+    @staticmethod
+    async def getsize(path: str) -> int:
+        try:
+            return await FileService.run(os.path.getsize, path)
+        except FileNotFoundError:
+            return 0
+
+    @staticmethod
+    async def replace(source: str, destination: str):
+        await FileService.run(os.replace, source, destination)
+
+    @staticmethod
+    async def remove(path: str):
+        try:
+            await FileService.run(os.remove, path)
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    async def touch(path: str):
+        await FileService.run(lambda: open(path, "wb").close())
+
+    @staticmethod
+    async def write_stream(path: str, offset: int, limit: int, stream: AsyncIterable[bytes]) -> int:
+        # Buffers incoming chunks up to ATTACHMENT_WRITE_CHUNK_SIZE so each executor call writes
+        # a sizeable block. Bytes past limit truncate the file back to offset and raise.
+        f = await FileService.run(open, path, "r+b")
+        buffer = bytearray()
+        position = offset
+
+        try:
+            await FileService.run(f.seek, offset)
+
+            async for chunk in stream:
+                if position + len(buffer) + len(chunk) > limit:
+                    buffer.clear()
+                    await FileService.run(f.truncate, offset)
+                    raise FileSizeExceeded()
+
+                buffer += chunk
+                if len(buffer) >= settings.ATTACHMENT_WRITE_CHUNK_SIZE:
+                    await FileService.run(f.write, bytes(buffer))
+                    position += len(buffer)
+                    buffer.clear()
+        finally:
+            if buffer:
+                await FileService.run(f.write, bytes(buffer))
+                position += len(buffer)
+            await FileService.run(f.close)
+
+        return position - offset
+
+    @staticmethod
+    async def iter_file(
+        path: str,
+        chunk_size: int | None = None,
+        start: int = 0,
+        end: int | None = None
+    ) -> AsyncIterator[bytes]:
+        # Positional reads on a raw descriptor: no Python file buffering, no seek, and the bytes
+        # from start to end (inclusive, default EOF) are yielded in chunk_size pieces
+        chunk_size = chunk_size or settings.ATTACHMENT_READ_CHUNK_SIZE
+        fd = await FileService.run(os.open, path, os.O_RDONLY)
+        position = start
+
+        try:
+            while end is None or position <= end:
+                length = chunk_size if end is None else min(chunk_size, end - position + 1)
+                chunk = await FileService.run(_read_at, fd, length, position)
+                if not chunk:
+                    break
+                position += len(chunk)
+                yield chunk
+        finally:
+            await FileService.run(os.close, fd)
@@ -0,0 +1,113 @@
+import base64
+import calendar
+import datetime
+import hashlib
+import hmac
+import json
+import time
+
+from abc import ABC, abstractmethod
+from functools import lru_cache
+
+from jose import JWTError, jwt
+
+from app.config import get_settings
+
+
+settings = get_settings()
+
+class InvalidToken(Exception):
+    pass
+
+class JWTBackend(ABC):
+    def __init__(self, secret: str, algorithm: str):
+        self.secret = secret
+        self.algorithm = algorithm
+
+    @abstractmethod
+    def encode(self, payload: dict) -> str:
+        ...
+
+    @abstractmethod
+    def decode(self, token: str) -> dict:
+        # Verified claims of token, or InvalidToken
+        ...
+
+class JoseBackend(JWTBackend):
+    def encode(self, payload: dict) -> str:
+        return jwt.encode(payload, self.secret, algorithm=self.algorithm)
+
+    def decode(self, token: str) -> dict:
+        try:
+            return jwt.decode(token, self.secret, algorithms=[self.algorithm])
+        except JWTError:
+            raise InvalidToken()
+
+HMAC_DIGESTS = {"HS256": hashlib.sha256, "HS384": hashlib.sha384, "HS512": hashlib.sha512}
+
+def _b64encode(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+def _claim_value(value):
+    if isinstance(value, datetime.datetime):
+        return calendar.timegm(value.utctimetuple())
+    return value
+
+class HMACBackend(JWTBackend):
+    # HS256/384/512 JWTs with only the standard library: one HMAC and two small JSON documents
+    # per token, without python-jose's generic key and algorithm handling. Tokens are
+    # interchangeable with JoseBackend ones.
+    def __init__(self, secret: str, algorithm: str):
+        if algorithm not in HMAC_DIGESTS:
+            raise ValueError(f"The hmac JWT backend does not support {algorithm}")
+        super().__init__(secret, algorithm)
+        self._key = secret.encode()
+        self._digest = HMAC_DIGESTS[algorithm]
+        self._header = _b64encode(json.dumps({"alg": algorithm, "typ": "JWT"}, separators=(",", ":")).encode())
+
+    def encode(self, payload: dict) -> str:
+        claims = {key: _claim_value(value) for key, value in payload.items()}
+        signing_input = self._header + b"." + _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+        signature = hmac.new(self._key, signing_input, self._digest).digest()
+        return (signing_input + b"." + _b64encode(signature)).decode()
+
+    def decode(self, token: str) -> dict:
+        try:
+            signing_input, signature = token.encode("ascii").rsplit(b".", 1)
+            header_segment, payload_segment = signing_input.split(b".")
+            header = json.loads(_b64decode(header_segment.decode()))
+            expected = hmac.new(self._key, signing_input, self._digest).digest()
+            # The algorithm is fixed by the settings, never taken from the token
+            if not isinstance(header, dict) or header.get("alg") != self.algorithm:
+                raise InvalidToken()
+            if not hmac.compare_digest(_b64decode(signature.decode()), expected):
+                raise InvalidToken()
+            payload = json.loads(_b64decode(payload_segment.decode()))
+        except (ValueError, UnicodeError):
+            raise InvalidToken()
+
+        if not isinstance(payload, dict):
+            raise InvalidToken()
+
+        now = time.time()
+        for claim in ("exp", "nbf", "iat"):
+            if claim in payload and not isinstance(payload[claim], (int, float)):
+                raise InvalidToken()
+        if "exp" in payload and payload["exp"] < now:
+            raise InvalidToken()
+        if "nbf" in payload and payload["nbf"] > now:
+            raise InvalidToken()
+
+        return payload
+
+JWT_BACKENDS: dict[str, type[JWTBackend]] = {
+    "jose": JoseBackend,
+    "hmac": HMACBackend,
+}
+
+@lru_cache
+def get_jwt_backend() -> JWTBackend:
+    return JWT_BACKENDS[settings.JWT_BACKEND](settings.JWT_SECRET_KEY, settings.JWT_ALGORITHM)
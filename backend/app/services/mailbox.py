@@ -0,0 +1,220 @@
+import datetime
+
+from typing import Any, AsyncIterator
+
+from sqlalchemy import ColumnElement, Connection, select, text, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import get_settings
+from app.models import MailboxCounter, Message, MessageRecipient
+
+
+settings = get_settings()
+
+
+RECONCILE_STATEMENTS = [
+    text(
+        "UPDATE messages SET "
+        "recipients_count = (SELECT COUNT(*) FROM message_recipients WHERE message_recipients.message_id = messages.id), "
+        "attachments_count = (SELECT COUNT(*) FROM attachments WHERE attachments.message_id = messages.id)"
+    ),
+    text(
+        "INSERT OR REPLACE INTO mailbox_counters (user_id, inbox_total, inbox_unread, sent_total) "
+        "SELECT users.id, "
+        "(SELECT COUNT(*) FROM message_recipients WHERE recipient_id = users.id AND is_deleted = 0), "
+        "(SELECT COUNT(*) FROM message_recipients WHERE recipient_id = users.id AND is_deleted = 0 AND is_read = 0), "
+        "(SELECT COUNT(*) FROM messages WHERE sender_id = users.id AND sender_deleted = 0) "
+        "FROM users"
+    ),
+]
+
+class MailboxService:
+    @staticmethod
+    def _upsert():
+        statement = insert(MailboxCounter)
+        return statement.on_conflict_do_update(
+            index_elements=[MailboxCounter.user_id],
+            set_={
+                "inbox_total": MailboxCounter.inbox_total + statement.excluded.inbox_total,
+                "inbox_unread": MailboxCounter.inbox_unread + statement.excluded.inbox_unread,
+                "sent_total": MailboxCounter.sent_total + statement.excluded.sent_total
+            }
+        )
+
+    @staticmethod
+    async def increment(
+        db: AsyncSession,
+        user_id: str,
+        inbox_total: int = 0,
+        inbox_unread: int = 0,
+        sent_total: int = 0
+    ):
+        if not (inbox_total or inbox_unread or sent_total):
+            return
+
+        await db.execute(
+            MailboxService._upsert(),
+            [{
+                "user_id": user_id,
+                "inbox_total": inbox_total,
+                "inbox_unread": inbox_unread,
+                "sent_total": sent_total
+            }]
+        )
+
+    @staticmethod
+    async def increment_inboxes(db: AsyncSession, user_ids: list[str], inbox_total: int = 0, inbox_unread: int = 0):
+        if not user_ids or not (inbox_total or inbox_unread):
+            return
+
+        await db.execute(
+            MailboxService._upsert(),
+            [
+                {
+                    "user_id": user_id,
+                    "inbox_total": inbox_total,
+                    "inbox_unread": inbox_unread,
+                    "sent_total": 0
+                }
+                for user_id in user_ids
+            ]
+        )
+
+    @staticmethod
+    async def get_counters(db: AsyncSession, user_id: str) -> MailboxCounter:
+        result = await db.execute(
+            select(MailboxCounter).where(MailboxCounter.user_id == user_id)
+        )
+        counters = result.scalar_one_or_none()
+
+        if counters is None:
+            return MailboxCounter(user_id=user_id, inbox_total=0, inbox_unread=0, sent_total=0)
+
+        return counters
+
+    @staticmethod
+    def _inbox_conditions(
+        user_id: str,
+        before: datetime.datetime | None
+    ) -> list[ColumnElement[bool]]:
+        conditions = [
+            MessageRecipient.recipient_id == user_id,
+            MessageRecipient.is_deleted == False
+        ]
+        if before is not None:
+            conditions.append(
+                MessageRecipient.message_id.in_(select(Message.id).where(Message.created_at < before))
+            )
+        return conditions
+
+    @staticmethod
+    async def _bulk_update(
+        db: AsyncSession,
+        conditions: list[ColumnElement[bool]],
+        values: dict[str, Any],
+        message_ids: list[str] | None
+    ) -> AsyncIterator[list[bool]]:
+        # Yields the previous is_read of the rows updated by each UPDATE ... RETURNING chunk,
+        # so at most one chunk of rows is held in memory however large the mailbox is
+        chunk_size = settings.BULK_UPDATE_CHUNK_SIZE
+
+        async def run(chunk_conditions: list[ColumnElement[bool]]) -> list[bool]:
+            result = await db.execute(
+                update(MessageRecipient)
+                .where(*chunk_conditions)
+                .values(**values)
+                .returning(MessageRecipient.is_read)
+                .execution_options(synchronize_session=False)
+            )
+            return list(result.scalars().all())
+
+        if message_ids is not None:
+            for start in range(0, len(message_ids), chunk_size):
+                yield await run(conditions + [MessageRecipient.message_id.in_(message_ids[start:start + chunk_size])])
+            return
+
+        while True:
+            chunk = (
+                select(MessageRecipient.id)
+                .where(*conditions)
+                .limit(chunk_size)
+                .scalar_subquery()
+            )
+            was_read = await run([MessageRecipient.id.in_(chunk)])
+            yield was_read
+
+            if len(was_read) < chunk_size:
+                return
+
+    @staticmethod
+    async def mark_read(
+        db: AsyncSession,
+        user_id: str,
+        message_ids: list[str] | None = None,
+        before: datetime.datetime | None = None
+    ) -> int:
+        conditions = MailboxService._inbox_conditions(user_id, before)
+        conditions.append(MessageRecipient.is_read == False)
+        values = {"is_read": True, "read_at": datetime.datetime.now(datetime.timezone.utc)}
+
+        updated = 0
+        async for was_read in MailboxService._bulk_update(db, conditions, values, message_ids):
+            await MailboxService.increment(db, user_id, inbox_unread=-len(was_read))
+            await db.commit()
+            updated += len(was_read)
+
+        return updated
+
+    @staticmethod
+    async def delete(
+        db: AsyncSession,
+        user_id: str,
+        message_ids: list[str] | None = None,
+        before: datetime.datetime | None = None
+    ) -> int:
+        conditions = MailboxService._inbox_conditions(user_id, before)
+        values = {"is_deleted": True, "deleted_at": datetime.datetime.now(datetime.timezone.utc)}
+
+        deleted = 0
+        async for was_read in MailboxService._bulk_update(db, conditions, values, message_ids):
+            await MailboxService.increment(db, user_id, inbox_total=-len(was_read), inbox_unread=-was_read.count(False))
+            await db.commit()
+            deleted += len(was_read)
+
+        return deleted
+
+    @staticmethod
+    async def delete_sent(db: AsyncSession, user_id: str, message_ids: list[str]) -> int:
+        # Only hides the messages from the sender; once no recipient has them either the
+        # garbage collector removes them
+        deleted = 0
+        for start in range(0, len(message_ids), settings.BULK_UPDATE_CHUNK_SIZE):
+            result = await db.execute(
+                update(Message)
+                .where(
+                    Message.sender_id == user_id,
+                    Message.sender_deleted == False,
+                    Message.id.in_(message_ids[start:start + settings.BULK_UPDATE_CHUNK_SIZE])
+                )
+                .values(sender_deleted=True)
+                .returning(Message.id)
+                .execution_options(synchronize_session=False)
+            )
+            count = len(result.scalars().all())
+            await MailboxService.increment(db, user_id, sent_total=-count)
+            await db.commit()
+            deleted += count
+
+        return deleted
+
+    @staticmethod
+    def reconcile_sync(conn: Connection):
+        for statement in RECONCILE_STATEMENTS:
+            conn.execute(statement)
+
+    @staticmethod
+    async def reconcile(db: AsyncSession):
+        for statement in RECONCILE_STATEMENTS:
+            await db.execute(statement)
+        await db.commit()
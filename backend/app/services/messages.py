@@ -0,0 +1,82 @@
+from typing import Any
+
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import get_settings
+from app.models import Attachment, Message, MessageBody, MessageRecipient
+from app.schemas.messages import MessageCreate
+from app.services.mailbox import MailboxService
+
+
+settings = get_settings()
+
+class MessageService:
+    @staticmethod
+    async def create_message(
+        db: AsyncSession,
+        message_id: str,
+        sender_id: str,
+        data: MessageCreate,
+        attachments: list[dict[str, Any]]
+    ):
+        # The id is generated up front, so the message, its recipient rows and its attachments
+        # are written with one INSERT each (executemany for the fan-out) without a flush
+        body_external = len(data.body_encrypted) > settings.MESSAGE_BODY_INLINE_MAX_SIZE
+
+        await db.execute(
+            insert(Message).values(
+                id=message_id,
+                sender_id=sender_id,
+                subject_encrypted=data.subject_encrypted,
+                body_encrypted=b"" if body_external else data.body_encrypted,
+                body_external=body_external,
+                signature=data.signature,
+                sender_encrypted_key=data.sender_encrypted_key,
+                recipients_count=len(data.recipients),
+                attachments_count=len(attachments)
+            )
+        )
+
+        if body_external:
+            await db.execute(
+                insert(MessageBody).values(message_id=message_id, body_encrypted=data.body_encrypted)
+            )
+
+        await db.execute(
+            insert(MessageRecipient),
+            [
+                {
+                    "message_id": message_id,
+                    "recipient_id": recipient.recipient_id,
+                    "encrypted_key": recipient.encrypted_key,
+                    "is_read": False,
+                    "is_deleted": False
+                }
+                for recipient in data.recipients
+            ]
+        )
+
+        if attachments:
+            await db.execute(
+                insert(Attachment),
+                [dict(attachment, message_id=message_id) for attachment in attachments]
+            )
+
+        await MailboxService.increment(db, sender_id, sent_total=1)
+        await MailboxService.increment_inboxes(
+            db,
+            [recipient.recipient_id for recipient in data.recipients],
+            inbox_total=1,
+            inbox_unread=1
+        )
+
+    @staticmethod
+    async def get_body(db: AsyncSession, message: Message) -> bytes:
+        if not message.body_external:
+            return message.body_encrypted
+
+        result = await db.execute(
+            select(MessageBody.body_encrypted).where(MessageBody.message_id == message.id)
+        )
+        return result.scalar_one()
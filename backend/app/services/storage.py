@@ -0,0 +1,275 @@
+import fcntl
+import hashlib
+import os
+import time
+
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import NamedTuple
+
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import get_settings
+from app.models import Attachment
+from app.services.files import FileService
+
+
+settings = get_settings()
+
+PACK_PREFIX = "pack:"
+
+class StoredBlob(NamedTuple):
+    path: str
+    offset: int
+    length: int
+
+def _write_file(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+def _move_file(source: str, destination: str):
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    os.replace(source, destination)
+    # A rename keeps the staged upload's mtime; the orphan sweep's grace period needs the time
+    # the file arrived here, before its attachment row is committed
+    os.utime(destination)
+
+def _read_blob(blob: StoredBlob) -> bytes:
+    fd = os.open(blob.path, os.O_RDONLY)
+    try:
+        return os.pread(fd, blob.length, blob.offset)
+    finally:
+        os.close(fd)
+
+def _read_and_remove(path: str) -> bytes:
+    with open(path, "rb") as f:
+        data = f.read()
+    os.remove(path)
+    return data
+
+def _list_packs(directory: str) -> list[str]:
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name[:-len(".pack")] for name in os.listdir(directory) if name.endswith(".pack"))
+
+def _compactable_packs(directory: str, cutoff: float) -> list[str]:
+    # Never the newest pack, which is still being appended to, nor a pack written to after cutoff:
+    # a send may have appended to it without having committed its attachment row yet
+    return [
+        name for name in _list_packs(directory)[:-1]
+        if not os.path.exists(os.path.join(directory, f"{name}.retired"))
+        and os.path.getmtime(os.path.join(directory, f"{name}.pack")) < cutoff
+    ]
+
+def _retire_pack(directory: str, name: str):
+    # The marker's mtime records when the pack's entries were moved out
+    open(os.path.join(directory, f"{name}.retired"), "w").close()
+
+def _remove_retired_packs(directory: str, cutoff: float) -> int:
+    removed = 0
+    if not os.path.isdir(directory):
+        return removed
+
+    for entry in os.listdir(directory):
+        if not entry.endswith(".retired"):
+            continue
+        marker = os.path.join(directory, entry)
+        if os.path.getmtime(marker) >= cutoff:
+            continue
+
+        pack = os.path.join(directory, f"{entry[:-len('.retired')]}.pack")
+        try:
+            removed += os.path.getsize(pack)
+            os.remove(pack)
+        except FileNotFoundError:
+            pass
+        os.remove(marker)
+
+    return removed
+
+def _append_to_pack(directory: str, max_pack_size: int, data: bytes) -> tuple[str, int]:
+    # The lock file serializes appends across threads and processes (e.g. a CLI compaction
+    # running next to the server); only the newest pack is ever appended to
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, ".lock"), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+
+        packs = _list_packs(directory)
+        name = packs[-1] if packs else "pack-000001"
+        path = os.path.join(directory, f"{name}.pack")
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+
+        if size and size + len(data) > max_pack_size:
+            name = f"pack-{int(name.split('-')[1]) + 1:06d}"
+            path = os.path.join(directory, f"{name}.pack")
+            size = 0
+
+        with open(path, "ab") as f:
+            f.write(data)
+
+        return name, size
+
+# Backends only decide where new blobs are written. Reading and deleting go through the
+# storage_path format, so rows written by any backend (including plain file paths from before
+# backends existed) keep working after ATTACHMENT_STORAGE_BACKEND changes
+class AttachmentStorage(ABC):
+    @abstractmethod
+    async def put(self, message_id: str, attachment_id: str, data: bytes) -> str:
+        ...
+
+    @abstractmethod
+    async def put_file(self, message_id: str, attachment_id: str, source: str) -> str:
+        ...
+
+    @staticmethod
+    def packs_dir() -> str:
+        return os.path.join(settings.ATTACHMENTS_DIR, "packs")
+
+    @staticmethod
+    def parse(storage_path: str) -> StoredBlob | None:
+        if not storage_path.startswith(PACK_PREFIX):
+            return None
+        name, offset, length = storage_path[len(PACK_PREFIX):].split(":")
+        return StoredBlob(os.path.join(AttachmentStorage.packs_dir(), f"{name}.pack"), int(offset), int(length))
+
+    @staticmethod
+    async def locate(storage_path: str) -> StoredBlob | None:
+        blob = AttachmentStorage.parse(storage_path)
+        if blob is not None:
+            return blob if await FileService.exists(blob.path) else None
+
+        if not await FileService.exists(storage_path):
+            return None
+        return StoredBlob(storage_path, 0, await FileService.getsize(storage_path))
+
+    @staticmethod
+    async def read(storage_path: str) -> bytes:
+        blob = await AttachmentStorage.locate(storage_path)
+        if blob is None:
+            raise FileNotFoundError(storage_path)
+        return await FileService.run(_read_blob, blob)
+
+    @staticmethod
+    async def delete(storage_path: str):
+        # Packed entries become dead space once their row is gone and are reclaimed by compaction
+        if not storage_path.startswith(PACK_PREFIX):
+            await FileService.remove(storage_path)
+
+# One directory per message, one file per attachment (the original layout)
+class DirectoryStorage(AttachmentStorage):
+    @staticmethod
+    def _path(message_id: str, attachment_id: str) -> str:
+        return os.path.join(settings.ATTACHMENTS_DIR, message_id, attachment_id)
+
+    async def put(self, message_id: str, attachment_id: str, data: bytes) -> str:
+        path = self._path(message_id, attachment_id)
+        await FileService.run(_write_file, path, data)
+        return path
+
+    async def put_file(self, message_id: str, attachment_id: str, source: str) -> str:
+        path = self._path(message_id, attachment_id)
+        await FileService.run(_move_file, source, path)
+        return path
+
+# One file per attachment under a fixed two-level fan-out of 256x256 directories
+class HashedStorage(AttachmentStorage):
+    @staticmethod
+    def _path(attachment_id: str) -> str:
+        digest = hashlib.sha256(attachment_id.encode()).hexdigest()
+        return os.path.join(settings.ATTACHMENTS_DIR, "objects", digest[:2], digest[2:4], attachment_id)
+
+    async def put(self, message_id: str, attachment_id: str, data: bytes) -> str:
+        path = self._path(attachment_id)
+        await FileService.run(_write_file, path, data)
+        return path
+
+    async def put_file(self, message_id: str, attachment_id: str, source: str) -> str:
+        path = self._path(attachment_id)
+        await FileService.run(_move_file, source, path)
+        return path
+
+# Small blobs are appended to shared packfiles, larger ones stored like HashedStorage. A packed
+# blob's storage_path is "pack:<pack name>:<offset>:<length>", so the attachment row itself is
+# the offset index. Packs are never rewritten in place: compaction copies the live entries of
+# a mostly-dead pack into the current pack and retires the old file, which is only unlinked by a
+# run ATTACHMENT_PACK_GRACE_MINUTES later so downloads already streaming from it can finish.
+class PackedStorage(HashedStorage):
+    async def _append(self, data: bytes) -> str:
+        name, offset = await FileService.run(
+            _append_to_pack, self.packs_dir(), settings.ATTACHMENT_PACK_MAX_SIZE, data
+        )
+        return f"{PACK_PREFIX}{name}:{offset}:{len(data)}"
+
+    async def put(self, message_id: str, attachment_id: str, data: bytes) -> str:
+        if len(data) > settings.ATTACHMENT_PACK_MAX_OBJECT_SIZE:
+            return await super().put(message_id, attachment_id, data)
+        return await self._append(data)
+
+    async def put_file(self, message_id: str, attachment_id: str, source: str) -> str:
+        if await FileService.getsize(source) > settings.ATTACHMENT_PACK_MAX_OBJECT_SIZE:
+            return await super().put_file(message_id, attachment_id, source)
+        return await self._append(await FileService.run(_read_and_remove, source))
+
+    async def compact(self, db: AsyncSession, min_dead_ratio: float | None = None) -> int:
+        if min_dead_ratio is None:
+            min_dead_ratio = settings.ATTACHMENT_PACK_COMPACT_RATIO
+
+        cutoff = time.time() - settings.ATTACHMENT_PACK_GRACE_MINUTES * 60
+        reclaimed = await FileService.run(_remove_retired_packs, self.packs_dir(), cutoff)
+        packs = await FileService.run(_compactable_packs, self.packs_dir(), cutoff)
+
+        for name in packs:
+            pack_path = os.path.join(self.packs_dir(), f"{name}.pack")
+            pack_size = await FileService.getsize(pack_path)
+
+            result = await db.execute(
+                select(Attachment.id, Attachment.storage_path)
+                .where(Attachment.storage_path.like(f"{PACK_PREFIX}{name}:%"))
+            )
+            live = result.all()
+            # Blobs are copied with no transaction open, so the writer connection is free while
+            # a large pack is read and re-appended
+            await db.rollback()
+            live_size = sum(self.parse(storage_path).length for _, storage_path in live)
+
+            if pack_size and (pack_size - live_size) / pack_size < min_dead_ratio:
+                continue
+
+            moves = [
+                {
+                    "attachment_id": attachment_id,
+                    "old_path": storage_path,
+                    "new_path": await self._append(await self.read(storage_path))
+                }
+                for attachment_id, storage_path in live
+            ]
+
+            # A row deleted meanwhile fails the storage_path guard and its copy is dead space
+            # in the current pack
+            statement = (
+                update(Attachment.__table__)
+                .where(
+                    Attachment.__table__.c.id == bindparam("attachment_id"),
+                    Attachment.__table__.c.storage_path == bindparam("old_path")
+                )
+                .values(storage_path=bindparam("new_path"))
+            )
+            for start in range(0, len(moves), settings.GC_BATCH_SIZE):
+                await db.execute(statement, moves[start:start + settings.GC_BATCH_SIZE])
+                await db.commit()
+
+            await FileService.run(_retire_pack, self.packs_dir(), name)
+
+        return reclaimed
+
+STORAGE_BACKENDS: dict[str, type[AttachmentStorage]] = {
+    "directory": DirectoryStorage,
+    "hashed": HashedStorage,
+    "packed": PackedStorage,
+}
+
+@lru_cache
+def get_storage() -> AttachmentStorage:
+    return STORAGE_BACKENDS[settings.ATTACHMENT_STORAGE_BACKEND]()
@@ -0,0 +1,248 @@
+import asyncio
+import datetime
+import logging
+import os
+import time
+import uuid
+
+from typing import Iterator
+
+from sqlalchemy import delete, func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import InstrumentedAttribute
+
+from app.config import get_settings
+from app.database import async_session_maker
+from app.models import Attachment, AttachmentUpload, Message, MessageBody, MessageRecipient, RevokedToken
+from app.services.files import FileService
+from app.services.storage import AttachmentStorage, PackedStorage
+
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+class SweepReport:
+    def __init__(self):
+        self.messages = 0
+        self.uploads = 0
+        self.revoked_tokens = 0
+        self.orphan_files = 0
+        self.directories = 0
+        self.reclaimed_bytes = 0
+
+    def __str__(self):
+        return (
+            f"{self.messages} messages, {self.uploads} expired uploads, {self.revoked_tokens} expired "
+            f"token revocations, {self.orphan_files} orphan files "
+            f"and {self.directories} empty directories removed, {self.reclaimed_bytes} bytes reclaimed"
+        )
+
+def _iter_old_files(root: str, skip: set[str], cutoff: float, batch_size: int) -> Iterator[list[tuple[str, int]]]:
+    batch = []
+    for directory, dirnames, filenames in os.walk(root):
+        dirnames[:] = [name for name in dirnames if os.path.join(directory, name) not in skip]
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if stat.st_mtime < cutoff:
+                batch.append((path, stat.st_size))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+def _remove_empty_dirs(root: str, skip: set[str], cutoff: float) -> int:
+    removed = 0
+    for directory, dirnames, filenames in os.walk(root, topdown=False):
+        if directory == root or directory in skip or filenames:
+            continue
+        try:
+            if os.stat(directory).st_mtime < cutoff:
+                os.rmdir(directory)
+                removed += 1
+        except OSError:
+            pass
+    return removed
+
+# Every step works in batches of GC_BATCH_SIZE rows or files, commits per batch and sleeps
+# GC_BATCH_DELAY between batches, so the writer connection and the attachment I/O pool are only
+# ever held briefly and foreground requests interleave with a long sweep
+class SweeperService:
+    @staticmethod
+    async def _pause(delay: float):
+        if delay:
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    async def _remove_files(storage_paths: list[str]) -> int:
+        reclaimed = 0
+        for storage_path in storage_paths:
+            if AttachmentStorage.parse(storage_path) is None:
+                reclaimed += await FileService.getsize(storage_path)
+            await AttachmentStorage.delete(storage_path)
+        return reclaimed
+
+    @staticmethod
+    async def sweep_messages(db: AsyncSession, report: SweepReport, batch_size: int, delay: float):
+        # Hard-deletes messages nobody can reach any more: the sender has deleted them from Sent
+        # (or the sender's account is gone) and so has every recipient. Candidates are walked in
+        # id order through ix_messages_unreachable, so a run never touches messages a sender
+        # still sees. Files are unlinked after the commit so a failed transaction never leaves
+        # rows pointing at missing files.
+        live_recipient = (
+            select(MessageRecipient.id)
+            .where(MessageRecipient.message_id == Message.id, MessageRecipient.is_deleted == False)
+            .exists()
+        )
+        unreachable = or_(Message.sender_id.is_(None), Message.sender_deleted == True)
+        cursor = str(uuid.UUID(int=0))
+
+        while True:
+            result = await db.execute(
+                select(Message.id).where(unreachable, Message.id > cursor).order_by(Message.id).limit(batch_size)
+            )
+            window = list(result.scalars().all())
+            if not window:
+                await db.rollback()
+                return
+            cursor = window[-1]
+
+            result = await db.execute(
+                select(
+                    Message.id,
+                    func.length(Message.body_encrypted) + func.coalesce(func.length(MessageBody.body_encrypted), 0)
+                )
+                .outerjoin(MessageBody, MessageBody.message_id == Message.id)
+                .where(Message.id.in_(window), ~live_recipient)
+            )
+            rows = result.all()
+
+            if not rows:
+                await db.rollback()
+            else:
+                message_ids = [message_id for message_id, _ in rows]
+                result = await db.execute(
+                    select(Attachment.storage_path).where(Attachment.message_id.in_(message_ids))
+                )
+                storage_paths = list(result.scalars().all())
+
+                await db.execute(delete(Attachment).where(Attachment.message_id.in_(message_ids)))
+                await db.execute(delete(MessageRecipient).where(MessageRecipient.message_id.in_(message_ids)))
+                await db.execute(delete(MessageBody).where(MessageBody.message_id.in_(message_ids)))
+                await db.execute(delete(Message).where(Message.id.in_(message_ids)))
+                await db.commit()
+
+                report.messages += len(rows)
+                report.reclaimed_bytes += sum(body_size or 0 for _, body_size in rows)
+                report.reclaimed_bytes += await SweeperService._remove_files(storage_paths)
+
+            await SweeperService._pause(delay)
+
+    @staticmethod
+    async def sweep_uploads(db: AsyncSession, report: SweepReport, batch_size: int, delay: float):
+        while True:
+            result = await db.execute(
+                select(AttachmentUpload.id, AttachmentUpload.storage_path)
+                .where(AttachmentUpload.expires_at < datetime.datetime.now(datetime.timezone.utc))
+                .limit(batch_size)
+            )
+            rows = result.all()
+            if not rows:
+                await db.rollback()
+                return
+
+            await db.execute(delete(AttachmentUpload).where(AttachmentUpload.id.in_([upload_id for upload_id, _ in rows])))
+            await db.commit()
+
+            report.uploads += len(rows)
+            report.reclaimed_bytes += await SweeperService._remove_files([storage_path for _, storage_path in rows])
+
+            await SweeperService._pause(delay)
+
+    @staticmethod
+    async def sweep_revoked_tokens(db: AsyncSession, report: SweepReport):
+        result = await db.execute(
+            delete(RevokedToken).where(RevokedToken.expires_at < datetime.datetime.now(datetime.timezone.utc))
+        )
+        await db.commit()
+        report.revoked_tokens += result.rowcount
+
+    @staticmethod
+    async def sweep_orphans(
+        db: AsyncSession,
+        report: SweepReport,
+        root: str,
+        id_column: InstrumentedAttribute[str],
+        batch_size: int,
+        delay: float,
+        skip: set[str] | None = None
+    ):
+        # Files are matched to rows by name (attachment and upload files are named after their
+        # id), which keeps working if ATTACHMENTS_DIR is later spelled differently. Files younger
+        # than GC_ORPHAN_GRACE_MINUTES are left alone because send_message and uploads write
+        # files before the row that references them is committed.
+        skip = skip or set()
+        cutoff = time.time() - settings.GC_ORPHAN_GRACE_MINUTES * 60
+        batches = _iter_old_files(root, skip, cutoff, batch_size)
+
+        while batch := await FileService.run(next, batches, None):
+            names = [os.path.basename(path) for path, _ in batch]
+            result = await db.execute(select(id_column).where(id_column.in_(names)))
+            referenced = set(result.scalars().all())
+            await db.rollback()
+
+            for path, size in batch:
+                if os.path.basename(path) not in referenced:
+                    await FileService.remove(path)
+                    report.orphan_files += 1
+                    report.reclaimed_bytes += size
+
+            await SweeperService._pause(delay)
+
+        report.directories += await FileService.run(_remove_empty_dirs, root, skip, cutoff)
+
+    @staticmethod
+    async def sweep(
+        db: AsyncSession,
+        batch_size: int | None = None,
+        delay: float | None = None
+    ) -> SweepReport:
+        batch_size = batch_size or settings.GC_BATCH_SIZE
+        delay = settings.GC_BATCH_DELAY if delay is None else delay
+        report = SweepReport()
+
+        await SweeperService.sweep_messages(db, report, batch_size, delay)
+        await SweeperService.sweep_uploads(db, report, batch_size, delay)
+        await SweeperService.sweep_revoked_tokens(db, report)
+
+        if os.path.isdir(settings.ATTACHMENTS_DIR):
+            await SweeperService.sweep_orphans(
+                db, report, settings.ATTACHMENTS_DIR, Attachment.id, batch_size, delay,
+                skip={AttachmentStorage.packs_dir(), settings.ATTACHMENT_UPLOADS_DIR}
+            )
+        if os.path.isdir(settings.ATTACHMENT_UPLOADS_DIR):
+            await SweeperService.sweep_orphans(
+                db, report, settings.ATTACHMENT_UPLOADS_DIR, AttachmentUpload.id, batch_size, delay
+            )
+
+        report.reclaimed_bytes += await PackedStorage().compact(db)
+
+        return report
+
+    @staticmethod
+    async def run_forever():
+        while True:
+            try:
+                async with async_session_maker() as session:
+                    report = await SweeperService.sweep(session)
+                logger.info(f"Garbage collection finished: {report}")
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Garbage collection failed")
+
+            await asyncio.sleep(settings.GC_INTERVAL_SECONDS)
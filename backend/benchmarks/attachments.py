@@ -0,0 +1,128 @@
+"""
+Concurrent attachment upload/download throughput through the API.
+
+Each client uploads one attachment through the chunked upload API, sends it in a
+message and downloads it again. Reports aggregate MB/s for both directions and the
+worst event loop stall seen while the transfers were running.
+
+Usage: python -m benchmarks.attachments [--clients 4] [--size-mb 25] [--chunk-mb 5]
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import tempfile
+import time
+
+data_dir = tempfile.mkdtemp()
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{data_dir}/bench.db")
+os.environ.setdefault("ATTACHMENTS_DIR", f"{data_dir}/attachments")
+os.environ.setdefault("ATTACHMENT_UPLOADS_DIR", f"{data_dir}/uploads")
+
+import httpx
+
+from app.database import async_session_maker, generate_uuid7
+from app.main import app
+from app.models import User
+from app.services import AuthService
+
+
+async def create_user() -> tuple[str, dict[str, str]]:
+    async with async_session_maker() as session:
+        user = User(
+            email=f"bench-{generate_uuid7()}@example.com",
+            username="bench",
+            password_hash="x",
+            signing_public_key="x"
+        ) # type: ignore[call-arg]
+        session.add(user)
+        await session.commit()
+
+    token = AuthService.create_access_token(user.id, user.email)
+    return user.id, {"Authorization": f"Bearer {token}"}
+
+async def upload(client: httpx.AsyncClient, headers: dict[str, str], content: bytes, chunk_size: int) -> str:
+    response = await client.post("/uploads/", headers=headers, json={
+        "filename_encrypted": "ZmlsZQ==",
+        "mime_type_encrypted": "YXBwbGljYXRpb24vcGRm",
+        "size": len(content) - 16,
+        "content_size": len(content),
+        "encryption_nonce": "0" * 24,
+        "checksum": hashlib.sha256(content).hexdigest()
+    })
+    upload_id = response.json()["id"]
+
+    for offset in range(0, len(content), chunk_size):
+        response = await client.put(
+            f"/uploads/{upload_id}",
+            headers=headers,
+            params={"offset": offset},
+            content=content[offset:offset + chunk_size]
+        )
+        response.raise_for_status()
+
+    (await client.post(f"/uploads/{upload_id}/finalize", headers=headers)).raise_for_status()
+    return upload_id
+
+async def send(client: httpx.AsyncClient, headers: dict[str, str], recipient_id: str, upload_id: str) -> tuple[str, str]:
+    response = await client.post("/messages/", headers=headers, json={
+        "subject_encrypted": "c3ViamVjdA==",
+        "body_encrypted": "Ym9keQ==",
+        "signature": "a" * 128,
+        "sender_encrypted_key": "a2V5",
+        "recipients": [{"recipient_id": recipient_id, "encrypted_key": "a2V5"}],
+        "attachment_upload_ids": [upload_id]
+    })
+    response.raise_for_status()
+    return response.json()["message_id"], upload_id
+
+async def download(client: httpx.AsyncClient, headers: dict[str, str], message_id: str, attachment_id: str) -> int:
+    response = await client.get(f"/messages/{message_id}/attachments/{attachment_id}", headers=headers)
+    response.raise_for_status()
+    return len(response.content)
+
+async def watch_loop_lag(stop: asyncio.Event, interval: float = 0.01) -> float:
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - start - interval)
+    return worst
+
+async def timed(coroutines) -> tuple[list, float, float]:
+    stop = asyncio.Event()
+    watcher = asyncio.create_task(watch_loop_lag(stop))
+    start = time.perf_counter()
+    results = await asyncio.gather(*coroutines)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    return results, elapsed, await watcher
+
+async def main(clients: int, size: int, chunk_size: int):
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None) as client:
+            sender_id, sender_headers = await create_user()
+            recipient_id, recipient_headers = await create_user()
+            contents = [os.urandom(size) for _ in range(clients)]
+            total_mb = clients * size / (1024 * 1024)
+
+            upload_ids, elapsed, lag = await timed(
+                upload(client, sender_headers, content, chunk_size) for content in contents
+            )
+            print(f"upload:   {clients} x {size / (1024 * 1024):.0f}MB in {elapsed:.2f}s = {total_mb / elapsed:.1f} MB/s (max loop stall {lag * 1000:.1f}ms)")
+
+            sent = [await send(client, sender_headers, recipient_id, upload_id) for upload_id in upload_ids]
+
+            _, elapsed, lag = await timed(
+                download(client, recipient_headers, message_id, attachment_id) for message_id, attachment_id in sent
+            )
+            print(f"download: {clients} x {size / (1024 * 1024):.0f}MB in {elapsed:.2f}s = {total_mb / elapsed:.1f} MB/s (max loop stall {lag * 1000:.1f}ms)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--size-mb", type=int, default=25)
+    parser.add_argument("--chunk-mb", type=int, default=5)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.clients, args.size_mb * 1024 * 1024, args.chunk_mb * 1024 * 1024))
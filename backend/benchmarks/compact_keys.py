@@ -0,0 +1,120 @@
+"""
+Index size and inbox query latency with text and with binary UUID keys.
+
+Seeds a database with 36-character text keys (the layout before migration 5), measures the
+size of the tables and indexes that carry keys and the latency of the inbox page query, then
+applies the key migration, vacuums and measures again.
+
+Usage: python -m benchmarks.compact_keys [--users 200] [--messages 20000] [--recipients 3] [--iterations 2000]
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+import uuid
+
+data_dir = tempfile.mkdtemp()
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{data_dir}/bench.db")
+os.environ.setdefault("ATTACHMENTS_DIR", f"{data_dir}/attachments")
+os.environ.setdefault("ATTACHMENT_UPLOADS_DIR", f"{data_dir}/uploads")
+
+from sqlalchemy import Connection
+
+from app.database import engine, generate_uuid7, init_db
+from app.migrations import KEY_COLUMNS, _convert_keys
+
+
+INBOX_QUERY = (
+    "SELECT messages.id, messages.sender_id, users.username, messages.subject_encrypted, "
+    "message_recipients.encrypted_key, message_recipients.is_read, messages.created_at "
+    "FROM message_recipients "
+    "JOIN messages ON messages.id = message_recipients.message_id "
+    "LEFT JOIN users ON users.id = messages.sender_id "
+    "WHERE message_recipients.recipient_id = ? AND message_recipients.is_deleted = 0 "
+    "AND message_recipients.message_id < ? "
+    "ORDER BY message_recipients.message_id DESC LIMIT 21"
+)
+
+def seed(conn: Connection, users: int, messages: int, recipients: int) -> list[str]:
+    user_ids = [str(uuid.uuid4()) for _ in range(users)]
+    conn.exec_driver_sql(
+        "INSERT INTO users (id, email, username, password_hash, signing_public_key, is_active, "
+        "totp_enabled, created_at, updated_at) VALUES (?, ?, 'bench', 'x', 'x', 1, 0, '2024-01-01', '2024-01-01')",
+        [(user_id, f"{user_id}@example.com") for user_id in user_ids]
+    )
+
+    message_rows = []
+    recipient_rows = []
+    for _ in range(messages):
+        message_id = generate_uuid7()
+        message_rows.append((message_id, random.choice(user_ids)))
+        for recipient_id in random.sample(user_ids, recipients):
+            recipient_rows.append((message_id, recipient_id))
+
+    conn.exec_driver_sql(
+        "INSERT INTO messages (id, sender_id, subject_encrypted, body_encrypted, body_external, "
+        "sender_encrypted_key, signature, created_at, recipients_count, attachments_count) "
+        f"VALUES (?, ?, x'00', x'00', 0, x'00', x'00', '2024-01-01', {recipients}, 0)",
+        message_rows
+    )
+    conn.exec_driver_sql(
+        "INSERT INTO message_recipients (message_id, recipient_id, encrypted_key, is_read, is_deleted) "
+        "VALUES (?, ?, x'00', 0, 0)",
+        recipient_rows
+    )
+    return user_ids
+
+def measure_sizes(conn: Connection) -> dict[str, int]:
+    rows = conn.exec_driver_sql(
+        "SELECT dbstat.name, SUM(dbstat.pgsize) FROM dbstat "
+        "JOIN sqlite_master ON sqlite_master.name = dbstat.name "
+        f"WHERE sqlite_master.tbl_name IN ({', '.join('?' * len(KEY_COLUMNS))}) "
+        "GROUP BY dbstat.name ORDER BY dbstat.name",
+        tuple(KEY_COLUMNS)
+    ).all()
+    return {name: size for name, size in rows}
+
+def time_inbox(conn: Connection, user_ids: list, cursor, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        conn.exec_driver_sql(INBOX_QUERY, (random.choice(user_ids), cursor)).all()
+    return (time.perf_counter() - start) / iterations * 1000
+
+def run(conn: Connection, users: int, messages: int, recipients: int, iterations: int):
+    user_ids = seed(conn, users, messages, recipients)
+    conn.commit()
+    conn.exec_driver_sql("VACUUM")
+    before_sizes = measure_sizes(conn)
+    # Text keys always sort below a string starting with "g", the first page of every inbox
+    before_latency = time_inbox(conn, user_ids, "g", iterations)
+
+    _convert_keys(conn)
+    conn.commit()
+    conn.exec_driver_sql("VACUUM")
+    after_sizes = measure_sizes(conn)
+    after_latency = time_inbox(conn, [uuid.UUID(user_id).bytes for user_id in user_ids], b"\xff" * 16, iterations)
+
+    print(f"{'object':<40} {'text KB':>10} {'binary KB':>10}")
+    for name in before_sizes:
+        print(f"{name:<40} {before_sizes[name] / 1024:>10.0f} {after_sizes.get(name, 0) / 1024:>10.0f}")
+    print(f"{'total':<40} {sum(before_sizes.values()) / 1024:>10.0f} {sum(after_sizes.values()) / 1024:>10.0f}")
+    print()
+    print(f"inbox page: {before_latency:.3f} ms text, {after_latency:.3f} ms binary")
+
+async def main(users: int, messages: int, recipients: int, iterations: int):
+    await init_db()
+    async with engine.connect() as conn:
+        await conn.run_sync(run, users, messages, recipients, iterations)
+    await engine.dispose()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--recipients", type=int, default=3)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.users, args.messages, args.recipients, args.iterations))
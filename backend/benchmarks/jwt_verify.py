@@ -0,0 +1,61 @@
+"""
+Access tokens verified per second on one core, for each JWT backend.
+
+For every backend in JWT_BACKENDS, reports the rate of the backend's decode (signature check
+and claim validation), then the rate of AuthService.verify_token when every token is already
+in the decoded-token cache. Also checks that tokens issued by one backend verify in the others.
+
+Usage: python -m benchmarks.jwt_verify [--tokens 1000] [--rounds 20]
+"""
+import argparse
+import time
+import uuid
+
+from app.config import get_settings
+from app.services import AuthService
+from app.services.auth import token_cache
+from app.services.jwt_backend import JWT_BACKENDS
+
+
+settings = get_settings()
+
+def rate(function, tokens: list[str], rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for token in tokens:
+            function(token)
+    return len(tokens) * rounds / (time.perf_counter() - start)
+
+def issue(backend, count: int) -> list[str]:
+    now = int(time.time())
+    return [
+        backend.encode({"sub": str(uuid.uuid4()), "email": "bench@example.com", "exp": now + 600, "iat": now, "type": "access", "ver": 0})
+        for _ in range(count)
+    ]
+
+def main(count: int, rounds: int):
+    backends = {name: backend(settings.JWT_SECRET_KEY, settings.JWT_ALGORITHM) for name, backend in JWT_BACKENDS.items()}
+    issued = {name: issue(backend, count) for name, backend in backends.items()}
+
+    print(f"{'backend':<20} {'verified/s':>12}")
+    for name, backend in backends.items():
+        print(f"{name:<20} {rate(backend.decode, issued[name], rounds):>12.0f}")
+
+    # The first call fills the cache, so this measures hits whatever JWT_BACKEND is
+    tokens = issued[settings.JWT_BACKEND]
+    token_cache.clear()
+    for token in tokens:
+        AuthService.verify_token(token)
+    print(f"{'cached verify_token':<20} {rate(AuthService.verify_token, tokens, rounds):>12.0f}")
+
+    for issuer, tokens in issued.items():
+        for name, backend in backends.items():
+            assert backend.decode(tokens[0])["sub"], f"{issuer} token rejected by {name}"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tokens", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    main(args.tokens, args.rounds)
@@ -0,0 +1,110 @@
+"""
+Insert throughput of the send_message write path for 1, 10 and 50 recipients.
+
+Compares the previous unit-of-work path (one ORM object per row plus a flush to get
+the message id) with MessageService.create_message (client-side id and executemany).
+
+Usage: python -m benchmarks.send_message [--messages 300]
+"""
+import argparse
+import asyncio
+import base64
+import os
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/bench.db")
+
+from app.database import async_session_maker, close_db, generate_uuid7, init_db
+from app.models import Message, MessageRecipient, User
+from app.schemas.messages import MessageCreate, RecipientKey
+from app.services import MailboxService, MessageService
+
+
+RECIPIENT_COUNTS = [1, 10, 50]
+
+def build_message(recipient_ids: list[str]) -> MessageCreate:
+    return MessageCreate(
+        subject_encrypted="c3ViamVjdA==",
+        body_encrypted=base64.b64encode(b"body" * 768).decode(),
+        signature="a" * 128,
+        sender_encrypted_key="a2V5",
+        recipients=[RecipientKey(recipient_id=recipient_id, encrypted_key="a2V5" * 86) for recipient_id in recipient_ids]
+    )
+
+async def create_users(count: int) -> list[str]:
+    async with async_session_maker() as session:
+        users = [
+            User(
+                email=f"bench-{generate_uuid7()}@example.com",
+                username="bench",
+                password_hash="x",
+                signing_public_key="x"
+            ) # type: ignore[call-arg]
+            for _ in range(count)
+        ]
+        session.add_all(users)
+        await session.commit()
+        return [user.id for user in users]
+
+async def send_unit_of_work(sender_id: str, data: MessageCreate):
+    async with async_session_maker() as session:
+        message = Message(
+            sender_id=sender_id,
+            subject_encrypted=data.subject_encrypted,
+            body_encrypted=data.body_encrypted,
+            signature=data.signature,
+            sender_encrypted_key=data.sender_encrypted_key,
+            recipients_count=len(data.recipients),
+            attachments_count=0
+        ) # type: ignore[call-arg]
+        session.add(message)
+        await session.flush()
+
+        for recipient in data.recipients:
+            session.add(MessageRecipient(
+                message_id=message.id,
+                recipient_id=recipient.recipient_id,
+                encrypted_key=recipient.encrypted_key
+            )) # type: ignore[call-arg]
+
+        await MailboxService.increment(session, sender_id, sent_total=1)
+        await MailboxService.increment_inboxes(
+            session,
+            [recipient.recipient_id for recipient in data.recipients],
+            inbox_total=1,
+            inbox_unread=1
+        )
+        await session.commit()
+
+async def send_bulk(sender_id: str, data: MessageCreate):
+    async with async_session_maker() as session:
+        await MessageService.create_message(session, generate_uuid7(), sender_id, data, [])
+        await session.commit()
+
+async def measure(send, sender_id: str, data: MessageCreate, messages: int) -> float:
+    start = time.perf_counter()
+    for _ in range(messages):
+        await send(sender_id, data)
+    return messages / (time.perf_counter() - start)
+
+async def main(messages: int):
+    await init_db()
+    sender_id, *recipient_ids = await create_users(max(RECIPIENT_COUNTS) + 1)
+
+    print(f"{'recipients':>10} {'path':<14} {'messages/s':>12} {'rows/s':>12}")
+    for count in RECIPIENT_COUNTS:
+        data = build_message(recipient_ids[:count])
+        for name, send in (("unit-of-work", send_unit_of_work), ("bulk", send_bulk)):
+            await measure(send, sender_id, data, max(messages // 10, 1))
+            rate = await measure(send, sender_id, data, messages)
+            print(f"{count:>10} {name:<14} {rate:>12.1f} {rate * (count + 1):>12.1f}")
+
+    await close_db()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=300)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.messages))
@@ -0,0 +1,134 @@
+"""
+Payload size and server CPU of the JSON and MessagePack encodings of the message APIs.
+
+For a send (MessageCreate with one attachment) and a read (MessageResponse) of each body
+size, reports the encoded size and the time spent in the request parsing dependency and
+the response rendering used by the routers.
+
+Usage: python -m benchmarks.wire_format [--iterations 200] [--attachment-kb 256]
+"""
+import argparse
+import asyncio
+import base64
+import datetime
+import hashlib
+import json
+import os
+import time
+
+import msgpack
+
+from starlette.requests import Request
+
+from app.routers.wire import MSGPACK_MEDIA_TYPES, wire_body, wire_response
+from app.schemas.messages import AttachmentResponse, MessageCreate, MessageResponse
+
+
+BODY_SIZES_KB = [1, 64, 700]
+
+def build_send(body_kb: int, attachment_kb: int) -> dict:
+    content = os.urandom(attachment_kb * 1024)
+    return {
+        "subject_encrypted": os.urandom(48),
+        "body_encrypted": os.urandom(body_kb * 1024),
+        "signature": "a" * 128,
+        "sender_encrypted_key": os.urandom(256),
+        "recipients": [{"recipient_id": f"recipient-{i}", "encrypted_key": os.urandom(256)} for i in range(5)],
+        "attachments": [{
+            "filename_encrypted": os.urandom(32),
+            "mime_type_encrypted": os.urandom(32),
+            "size": len(content),
+            "content_encrypted": content,
+            "encryption_nonce": "0" * 24,
+            "checksum": hashlib.sha256(content).hexdigest()
+        }]
+    }
+
+def as_json(value):
+    if isinstance(value, dict):
+        return {key: as_json(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [as_json(item) for item in value]
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode()
+    return value
+
+def build_read(body_kb: int) -> MessageResponse:
+    return MessageResponse(
+        id="message",
+        subject_encrypted=base64.b64encode(os.urandom(48)).decode(),
+        body_encrypted=base64.b64encode(os.urandom(body_kb * 1024)).decode(),
+        signature="a" * 128,
+        encrypted_key=base64.b64encode(os.urandom(256)).decode(),
+        attachments=[
+            AttachmentResponse(
+                id=f"attachment-{i}",
+                filename_encrypted=base64.b64encode(os.urandom(32)).decode(),
+                mime_type_encrypted=base64.b64encode(os.urandom(32)).decode(),
+                size=1024,
+                encryption_nonce="0" * 24,
+                checksum="0" * 64
+            )
+            for i in range(3)
+        ],
+        created_at=datetime.datetime.now(datetime.timezone.utc),
+        is_read=False
+    )
+
+def make_request(body: bytes, content_type: str, accept: str) -> Request:
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/",
+        "headers": [(b"content-type", content_type.encode()), (b"accept", accept.encode())],
+    }
+    return Request(scope, receive)
+
+async def time_parse(body: bytes, content_type: str, iterations: int) -> float:
+    parse = wire_body(MessageCreate)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await parse(make_request(body, content_type, content_type))
+    return (time.perf_counter() - start) / iterations * 1000
+
+def time_render(data: MessageResponse, accept: str, iterations: int) -> tuple[float, int]:
+    request = make_request(b"", "application/json", accept)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        response = wire_response(request, data)
+        # FastAPI renders a returned model through the response_model and JSONResponse
+        content = response.body if not isinstance(response, MessageResponse) else json.dumps(
+            response.model_dump(mode="json"), ensure_ascii=False, separators=(",", ":")
+        ).encode()
+    return (time.perf_counter() - start) / iterations * 1000, len(content)
+
+async def main(iterations: int, attachment_kb: int):
+    print(f"{'body':>7} {'op':<5} {'format':<8} {'bytes':>10} {'ms/op':>8}")
+
+    for body_kb in BODY_SIZES_KB:
+        payload = build_send(body_kb, attachment_kb)
+        encoded = {
+            "json": (json.dumps(as_json(payload)).encode(), "application/json"),
+            "msgpack": (msgpack.packb(payload), MSGPACK_MEDIA_TYPES[0]),
+        }
+        for name, (body, content_type) in encoded.items():
+            await time_parse(body, content_type, max(iterations // 10, 1))
+            elapsed = await time_parse(body, content_type, iterations)
+            print(f"{body_kb:>5}KB {'send':<5} {name:<8} {len(body):>10} {elapsed:>8.3f}")
+
+        data = build_read(body_kb)
+        for name, accept in (("json", "application/json"), ("msgpack", MSGPACK_MEDIA_TYPES[0])):
+            time_render(data, accept, max(iterations // 10, 1))
+            elapsed, size = time_render(data, accept, iterations)
+            print(f"{body_kb:>5}KB {'read':<5} {name:<8} {size:>10} {elapsed:>8.3f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--attachment-kb", type=int, default=256)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.iterations, args.attachment_kb))
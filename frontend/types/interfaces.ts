@@ -114,6 +114,7 @@ export interface MessageListResponse {
   page: number;
   page_size: number;
   total_pages: number;
+  next_cursor?: string | null;
 }
 
 export interface GetMessageResponse {